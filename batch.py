@@ -0,0 +1,293 @@
+"""Headless batch processing of many videos without the Streamlit UI.
+
+Usage:
+    python batch.py videos/ --output backfill/
+    python batch.py --manifest nightly.txt --output backfill/ --transcribe-workers 2 --render-workers 2
+    python batch.py https://www.youtube.com/watch?v=... another.mp4 --output backfill/
+
+Each video moves through ingest -> transcribe -> highlights -> render on separate worker pools, so one
+video can transcribe while another renders. Progress is checkpointed per video in <output>/<id>/state.json,
+so an interrupted run resumes where it stopped. Every finished video is appended to <output>/results.jsonl.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+STAGES = ("ingest", "transcribe", "highlights", "render")
+
+
+def is_url(source):
+    return re.match(r'^https?://', source) is not None
+
+
+def discover_inputs(sources, manifest=None):
+    """Expand directories into their video files and append manifest lines, keeping order and dropping repeats"""
+    found = []
+    if manifest:
+        with open(manifest, encoding='utf-8') as f:
+            sources = list(sources) + [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    for source in sources:
+        if not is_url(source) and os.path.isdir(source):
+            found.extend(sorted(os.path.join(os.path.abspath(source), name) for name in os.listdir(source)
+                                if name.lower().endswith(VIDEO_EXTENSIONS)))
+        else:
+            found.append(source if is_url(source) else os.path.abspath(source))
+    return list(dict.fromkeys(found))
+
+
+def item_id(source):
+    """Stable directory name for an input: a readable slug plus a hash of the full source"""
+    name = source.rstrip('/').rsplit('/', 1)[-1] if is_url(source) else os.path.splitext(os.path.basename(source))[0]
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', name)[:40].strip('_') or 'video'
+    return f"{slug}-{hashlib.sha1(source.encode('utf-8')).hexdigest()[:10]}"
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(path, state):
+    staging = f"{path}.tmp"
+    with open(staging, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, default=float)
+    os.replace(staging, path)
+
+
+def stage_ingest(item, report):
+    source = item['source']
+    if is_url(source):
+        video_path = main.download_youtube_video(source, item['dir'])
+    elif os.path.isfile(source):
+        video_path = source
+    else:
+        raise FileNotFoundError(f"Input not found: {source}")
+    info = main.probe_media(video_path)
+    return {'video_path': video_path, 'duration': info['duration'], 'has_audio': info['has_audio']}
+
+
+def stage_transcribe(item, report):
+    ingest = item['state']['stages']['ingest']
+    if not ingest['has_audio']:
+        whisper_result = {'text': '', 'segments': [], 'language': None}
+    else:
+        # decoded audio lives on the scratch volume and is deleted as soon as the block ends
+        with main.scratch_space(f"batch-{item['id']}") as scratch:
+            whisper_result = main.transcribe_media(
+                ingest['video_path'], ingest['duration'], workdir=scratch,
+                on_chunk=lambda done, total, partial: report(item, "transcribe", f"chunk {done}/{total}"))
+    transcript_path = os.path.join(item['dir'], "transcript.json")
+    with open(transcript_path, 'w', encoding='utf-8') as f:
+        json.dump(whisper_result, f, default=float)
+    return {'transcript_path': transcript_path, 'characters': len(whisper_result.get('text', ''))}
+
+
+def stage_highlights(item, report):
+    ingest = item['state']['stages']['ingest']
+    duration = ingest['duration']
+    with open(item['state']['stages']['transcribe']['transcript_path'], encoding='utf-8') as f:
+        whisper_result = json.load(f)
+    transcript = main.build_transcript(whisper_result)
+    try:
+        with main.scratch_space(f"batch-{item['id']}") as scratch:
+            candidates = main.prescore_highlight_windows(ingest['video_path'], transcript, duration,
+                                                         video_path=ingest['video_path'], workdir=scratch)
+    except Exception as e:
+        report(item, "highlights", f"pre-scoring failed: {e}")
+        candidates = []
+    warnings = []
+    highlights = main.choose_highlights(whisper_result, duration, candidates, on_warning=warnings.append)
+    if not highlights['timestamps']:
+        raise RuntimeError("No highlights found")
+    return {'timestamps': [list(t) for t in highlights['timestamps']], 'highlight_source': highlights['source'],
+            'gpt_response': highlights['gpt_response'], 'llm': main.summarize_llm_calls(highlights['calls']),
+            'warnings': warnings}
+
+
+def stage_render(item, report):
+    ingest = item['state']['stages']['ingest']
+    timestamps = item['state']['stages']['highlights']['timestamps']
+    output_paths = [os.path.join(item['dir'], f"reel_{i + 1}.mp4") for i in range(len(timestamps))]
+    renditions = main.profile_renditions()
+    source_frame_rate = main.probe_media(ingest['video_path'])['frame_rate']
+    results = main.render_reels(
+        ingest['video_path'], [tuple(t) for t in timestamps], output_paths, video_duration=ingest['duration'],
+        on_progress=lambda done, total, result: report(item, "render", f"reel {done}/{total}"),
+        renditions=renditions)
+    reels = []
+    for number, result in enumerate(results, 1):
+        reel = {'number': number, 'start': result['start'], 'end': result['end'], 'path': None,
+                'quality': None, 'error': result['error'], 'renditions': result.get('renditions', {})}
+        if result['success'] and result.get('renditions'):
+            reel['path'] = result['path']
+            # every rendition is checked against its own profile, as the app does
+            qualities = {rendition['key']: main.evaluate_reel_quality(
+                result['renditions'][rendition['key']], result['start'], result['end'],
+                expected_frame_rate=source_frame_rate, expected_resolution=(rendition['width'], rendition['height']))
+                for rendition in renditions}
+            issues = [f"{key}: {issue}" for key, quality in qualities.items() for issue in quality['issues']]
+            reel['quality'] = dict(qualities[renditions[0]['key']], renditions=qualities, issues=issues)
+        elif result['success']:
+            reel['path'] = result['path']
+            reel['quality'] = main.evaluate_reel_quality(
+                result['path'], result['start'], result['end'], expected_frame_rate=source_frame_rate,
+                expected_resolution=(renditions[0]['width'], renditions[0]['height']))
+        reels.append(reel)
+    if not any(reel['path'] for reel in reels):
+        raise RuntimeError("; ".join(reel['error'] or "render failed" for reel in reels))
+    return {'reels': reels}
+
+
+STAGE_FUNCTIONS = {
+    "ingest": stage_ingest,
+    "transcribe": stage_transcribe,
+    "highlights": stage_highlights,
+    "render": stage_render,
+}
+
+
+def print_progress(item, stage, message):
+    print(f"[{time.strftime('%H:%M:%S')}] {item['id']} {stage}: {message}", file=sys.stderr, flush=True)
+
+
+def _run_item_stage(batch, item, stage):
+    batch['on_progress'](item, stage, "started")
+    metrics = {}
+    try:
+        with main.measure_stage(metrics):
+            data = STAGE_FUNCTIONS[stage](item, batch['on_progress'])
+    except Exception as e:
+        item['state'].update(status='failed', error=f"{stage}: {e}")
+        save_checkpoint(item['checkpoint'], item['state'])
+        batch['on_progress'](item, stage, f"failed: {e}")
+        return False
+    item['state']['stages'][stage] = dict(data, metrics=metrics)
+    save_checkpoint(item['checkpoint'], item['state'])
+    batch['on_progress'](item, stage, f"done in {metrics['wall_seconds']}s")
+    return True
+
+
+def _advance(batch, item, index=0):
+    """Submit the item's next unfinished stage to that stage's pool, or finish the item"""
+    while index < len(STAGES) and STAGES[index] in item['state']['stages']:
+        index += 1
+    if index == len(STAGES):
+        item['state'].update(status='done', error=None)
+        save_checkpoint(item['checkpoint'], item['state'])
+        _finish(batch, item)
+        return
+    stage = STAGES[index]
+
+    def on_done(future):
+        try:
+            succeeded = future.result()
+        except Exception:
+            succeeded = False
+        if succeeded:
+            _advance(batch, item, index + 1)
+        else:
+            _finish(batch, item)
+
+    batch['pools'][stage].submit(_run_item_stage, batch, item, stage).add_done_callback(on_done)
+
+
+def _finish(batch, item):
+    state = item['state']
+    reels = state['stages'].get('render', {}).get('reels', [])
+    record = {
+        'id': item['id'],
+        'source': item['source'],
+        'status': state['status'],
+        'error': state.get('error'),
+        'duration': state['stages'].get('ingest', {}).get('duration'),
+        'highlight_source': state['stages'].get('highlights', {}).get('highlight_source'),
+        'reels': [dict({key: reel.get(key) for key in ('number', 'start', 'end', 'path', 'renditions', 'error')},
+                       issues=(reel['quality'] or {}).get('issues', [])) for reel in reels],
+        'stage_seconds': {stage: data['metrics']['wall_seconds'] for stage, data in state['stages'].items()},
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with batch['lock']:
+        with open(batch['results_path'], 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, default=float) + "\n")
+        batch['summary'][state['status']] += 1
+    batch['in_flight'].release()
+    batch['finished'].release()
+
+
+def run_batch(sources, output_dir, workers=None, max_in_flight=4, force=False, on_progress=None):
+    """Process every source through the overlapped stage pools; returns counts of done, failed and skipped videos"""
+    workers = dict({'ingest': 2, 'transcribe': 1, 'highlights': 4, 'render': 1}, **(workers or {}))
+    os.makedirs(output_dir, exist_ok=True)
+    batch = {
+        'pools': {stage: ThreadPoolExecutor(max_workers=max(1, workers[stage]), thread_name_prefix=f"batch-{stage}")
+                  for stage in STAGES},
+        'lock': threading.Lock(),
+        'in_flight': threading.BoundedSemaphore(max(1, max_in_flight)),
+        'finished': threading.Semaphore(0),
+        'results_path': os.path.join(output_dir, "results.jsonl"),
+        'summary': {'done': 0, 'failed': 0, 'skipped': 0},
+        'on_progress': on_progress or print_progress,
+    }
+    started = 0
+    try:
+        for source in sources:
+            item = {'id': item_id(source), 'source': source}
+            item['dir'] = os.path.abspath(os.path.join(output_dir, item['id']))
+            item['checkpoint'] = os.path.join(item['dir'], "state.json")
+            os.makedirs(item['dir'], exist_ok=True)
+            state = None if force else load_checkpoint(item['checkpoint'])
+            if state and state.get('status') == 'done':
+                batch['summary']['skipped'] += 1
+                continue
+            item['state'] = state or {'source': source, 'stages': {}}
+            item['state'].update(status='running', error=None)
+            # bounding videos in flight bounds the disk and memory held by half-processed videos
+            batch['in_flight'].acquire()
+            started += 1
+            _advance(batch, item)
+        for _ in range(started):
+            batch['finished'].acquire()
+    finally:
+        for pool in batch['pools'].values():
+            pool.shutdown(wait=True)
+    return batch['summary']
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Create reels for many videos without the Streamlit UI")
+    parser.add_argument("sources", nargs="*", help="video files, directories of videos or YouTube URLs")
+    parser.add_argument("--manifest", help="file with one video path or URL per line")
+    parser.add_argument("--output", default="reelify_batch", help="output directory (default: reelify_batch)")
+    parser.add_argument("--ingest-workers", type=int, default=2)
+    parser.add_argument("--transcribe-workers", type=int, default=1)
+    parser.add_argument("--highlight-workers", type=int, default=4)
+    parser.add_argument("--render-workers", type=int, default=1)
+    parser.add_argument("--max-in-flight", type=int, default=4, help="videos being processed at once (default: 4)")
+    parser.add_argument("--force", action="store_true", help="reprocess videos already marked done")
+    args = parser.parse_args(argv)
+
+    sources = discover_inputs(args.sources, args.manifest)
+    if not sources:
+        parser.error("no input videos found")
+    summary = run_batch(sources, args.output, {'ingest': args.ingest_workers, 'transcribe': args.transcribe_workers,
+                                               'highlights': args.highlight_workers, 'render': args.render_workers},
+                        args.max_in_flight, args.force)
+    print(f"{summary['done']} done, {summary['failed']} failed, {summary['skipped']} skipped; "
+          f"results in {os.path.join(args.output, 'results.jsonl')}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
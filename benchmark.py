@@ -0,0 +1,410 @@
+"""Headless benchmarks for the reel pipeline.
+
+Usage:
+    python benchmark.py backends input.mp4 --start 10 --end 40 --runs 3
+    python benchmark.py transcribe input.mp4 --chunks 1 2 4 8 --workers 4
+    python benchmark.py db --threads 16 --seconds 5
+    python benchmark.py pipeline --resolutions 640x360 1920x1080 --lengths 30 120 --baseline bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import shutil
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+import llm_stub
+
+
+def benchmark_render_backends(video_path, start, end, runs=3, backends=("moviepy", "ffmpeg"), preset=None, crf=None):
+    """Render the same segment with each backend and report timings and quality checks"""
+    report = {}
+    workdir = tempfile.mkdtemp(prefix="reelify-bench-")
+    try:
+        for backend in backends:
+            timings = []
+            quality = None
+            error = None
+            for run in range(runs):
+                output_path = os.path.join(workdir, f"{backend}_{run}.mp4")
+                result = main.render_reel(video_path, start, end, output_path,
+                                          backend=backend, preset=preset, crf=crf)
+                if not result['success']:
+                    error = result['error']
+                    break
+                timings.append(result['render_seconds'])
+                quality = main.evaluate_reel_quality(output_path, result['start'], result['end'])
+            report[backend] = {
+                'runs': len(timings),
+                'median_seconds': round(statistics.median(timings), 3) if timings else None,
+                'min_seconds': round(min(timings), 3) if timings else None,
+                'quality_passed': bool(quality and quality['duration_check'] and quality['resolution_check']),
+                'issues': quality['issues'] if quality else [],
+                'error': error,
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def print_backend_report(report):
+    print(f"{'backend':<10} {'runs':>4} {'median s':>10} {'min s':>8}  quality")
+    for backend, row in report.items():
+        if row['error']:
+            print(f"{backend:<10} failed: {row['error']}")
+            continue
+        status = "ok" if row['quality_passed'] else "FAIL " + "; ".join(row['issues'])
+        print(f"{backend:<10} {row['runs']:>4} {row['median_seconds']:>10} {row['min_seconds']:>8}  {status}")
+    timed = {b: r['median_seconds'] for b, r in report.items() if r['median_seconds']}
+    if "moviepy" in timed and "ffmpeg" in timed:
+        print(f"ffmpeg speedup: {timed['moviepy'] / timed['ffmpeg']:.2f}x")
+
+
+def media_duration(path):
+    return main.probe_media(path)['duration']
+
+
+def benchmark_transcription(media_path, chunk_counts=(1, 2, 4, 8), workers=None, model_size=None):
+    """Wall time of transcribe_media as the audio is split into more chunks"""
+    duration = media_duration(media_path)
+    rows = []
+    for count in chunk_counts:
+        chunk_workers = 1 if count == 1 else (workers or main.TRANSCRIBE_WORKERS)
+        started = time.perf_counter()
+        result = main.transcribe_media(media_path, duration, model_size=model_size, workers=chunk_workers,
+                                       chunk_seconds=duration / count)
+        wall = time.perf_counter() - started
+        rows.append({'chunks': count, 'workers': chunk_workers, 'wall_seconds': round(wall, 2),
+                     'realtime_factor': round(duration / wall, 2) if wall else None,
+                     'segments': len(result.get('segments', []))})
+    return rows
+
+
+def print_transcription_report(rows):
+    print(f"{'chunks':>6} {'workers':>7} {'wall s':>8} {'x realtime':>10} {'segments':>8}")
+    for row in rows:
+        print(f"{row['chunks']:>6} {row['workers']:>7} {row['wall_seconds']:>8} {row['realtime_factor']:>10} {row['segments']:>8}")
+
+
+def _ops_per_second(operation, threads, seconds):
+    counts = [0] * threads
+    errors = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        n = 0
+        while time.perf_counter() < deadline:
+            try:
+                operation(index, n)
+                counts[index] += 1
+            except Exception:
+                errors[index] += 1
+            n += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {'ops_per_second': round(sum(counts) / elapsed, 1), 'errors': sum(errors)}
+
+
+def benchmark_database(threads=16, seconds=5, users=50):
+    """Logins and history reads per second against a fresh database shared by many threads"""
+    workdir = tempfile.mkdtemp(prefix="reelify-db-bench-")
+    main.DB_PATH = os.path.join(workdir, "bench.db")
+    try:
+        main.init_database()
+        emails = [f"user{i}@bench.local" for i in range(users)]
+        for i, email in enumerate(emails):
+            main.register_user(f"User {i}", email, "benchmark")
+        with main.db_connection() as conn:
+            user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+        for n in range(users * 20):
+            main.save_processing_history(user_ids[n % len(user_ids)], f"video_{n}.mp4", 60.0, 3)
+        main.flush_processing_history()
+        return {
+            'login': _ops_per_second(lambda i, n: main.login_user(emails[(i + n) % users], "benchmark"), threads, seconds),
+            'history_read': _ops_per_second(lambda i, n: main.get_user_history(user_ids[(i + n) % len(user_ids)]),
+                                            threads, seconds),
+            'history_write': _ops_per_second(lambda i, n: main.save_processing_history(
+                user_ids[(i + n) % len(user_ids)], "bench.mp4", 1.0, 1), threads, seconds),
+        }
+    finally:
+        main.flush_processing_history()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_database_report(report, threads):
+    print(f"{threads} threads")
+    for operation, row in report.items():
+        print(f"{operation:<14} {row['ops_per_second']:>10} ops/s  errors: {row['errors']}")
+    print("(login throughput is bounded by bcrypt, not SQLite)")
+
+
+PIPELINE_STAGES = ("probe", "audio_preview", "decode_audio", "transcribe", "prescore", "highlights", "render",
+                   "quality", "zip")
+
+
+def generate_synthetic_video(path, width, height, seconds, fps=30):
+    """Deterministic H.264/AAC test clip from ffmpeg's testsrc2 pattern and a sine tone"""
+    video = main.ffmpeg.input(f"testsrc2=size={width}x{height}:rate={fps}:duration={seconds}", format='lavfi')
+    audio = main.ffmpeg.input(f"sine=frequency=440:beep_factor=4:duration={seconds}", format='lavfi')
+    (
+        main.ffmpeg.output(video, audio, path, vcodec='libx264', preset='veryfast', pix_fmt='yuv420p',
+                           acodec='aac', shortest=None)
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return path
+
+
+def synthetic_whisper_result(duration, segment_seconds=4.0):
+    """Whisper-shaped transcript with one short sentence per segment, so later stages get the same input every run"""
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = min(duration, start + segment_seconds)
+        words = " ".join(f"word{(int(start) + n) % 50}" for n in range(4 + len(segments) % 5))
+        segments.append({'start': start, 'end': end, 'text': f" Segment {len(segments)} says {words}."})
+        start = end
+    return {'text': "".join(segment['text'] for segment in segments), 'segments': segments, 'language': 'en'}
+
+
+def _run_stage(report, stage, source_seconds, function):
+    metrics = {}
+    try:
+        with main.measure_stage(metrics):
+            value = function()
+    except Exception as e:
+        report[stage] = {'error': str(e)}
+        return None
+    wall = metrics['wall_seconds']
+    report[stage] = dict(metrics, throughput=round(source_seconds / wall, 2) if wall and source_seconds else None)
+    return value
+
+
+def benchmark_pipeline_case(video_path, workdir, transcribe=True, model_size=None):
+    """Run every pipeline stage once on one clip; returns {stage: metrics with throughput in source-s per wall-s}"""
+    report = {}
+    main._probe_cache()['entries'].clear()
+    duration = _run_stage(report, "probe", None, lambda: main.probe_media(video_path)['duration'])
+    if duration is None:
+        return report
+    if report["probe"]['wall_seconds']:
+        report["probe"]['throughput'] = round(duration / report["probe"]['wall_seconds'], 2)
+    _run_stage(report, "audio_preview", duration,
+               lambda: main.create_audio_preview(video_path, os.path.join(workdir, "preview.m4a")))
+    _run_stage(report, "decode_audio", duration, lambda: len(main.decode_audio(video_path, duration, workdir)))
+    if transcribe:
+        _run_stage(report, "transcribe", duration,
+                   lambda: main.transcribe_media(video_path, duration, model_size=model_size, workdir=workdir))
+    # a sine tone has no speech, so later stages read a synthetic transcript to stay reproducible
+    transcript = main.build_transcript(synthetic_whisper_result(duration))
+    _run_stage(report, "prescore", duration,
+               lambda: main.prescore_highlight_windows(video_path, transcript, duration, video_path=video_path,
+                                                       workdir=workdir))
+    timestamps = _run_stage(report, "highlights", duration, lambda: main.extract_segments_from_gpt_response(
+        main.select_highlights(transcript)[0], transcript)) or []
+    if not timestamps:
+        return report
+    output_paths = [os.path.join(workdir, f"reel_{i + 1}.mp4") for i in range(len(timestamps))]
+    reel_seconds = sum(end - start for start, end in timestamps)
+    renders = _run_stage(report, "render", reel_seconds, lambda: main.render_reels(
+        video_path, timestamps, output_paths, video_duration=duration)) or []
+    rendered = [r for r in renders if r['success']]
+    if len(rendered) < len(timestamps):
+        report["render"]['failed'] = [r['error'] for r in renders if not r['success']]
+    _run_stage(report, "quality", sum(r['end'] - r['start'] for r in rendered), lambda: [
+        main.evaluate_reel_quality(r['path'], r['start'], r['end']) for r in rendered])
+    _run_stage(report, "zip", sum(r['end'] - r['start'] for r in rendered),
+               lambda: main.create_download_zip([r['path'] for r in rendered], workdir))
+    return report
+
+
+def _pipeline_case_worker(video_path, run_dir, transcribe, model_size, llm_base_url):
+    main.LLM_BASE_URL = llm_base_url
+    # the stub ignores the key, but the OpenAI client refuses to start without one
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    # an empty LLM cache per run keeps the highlights stage measuring a real (stub) round trip
+    main.LLM_CACHE_DIR = os.path.join(run_dir, "llm")
+    return benchmark_pipeline_case(video_path, run_dir, transcribe, model_size)
+
+
+def _median_stage(runs):
+    merged = {}
+    for stage in PIPELINE_STAGES:
+        rows = [run[stage] for run in runs if stage in run]
+        if not rows:
+            continue
+        if any('error' in row for row in rows):
+            merged[stage] = next(row for row in rows if 'error' in row)
+            continue
+        merged[stage] = {field: statistics.median(row[field] for row in rows)
+                         for field in rows[0] if all(isinstance(r.get(field), (int, float)) for r in rows)}
+        failed = [error for row in rows for error in row.get('failed', [])]
+        if failed:
+            merged[stage]['failed'] = failed
+    return merged
+
+
+def benchmark_pipeline(resolutions=("640x360", "1280x720", "1920x1080"), lengths=(30, 120), runs=1,
+                       transcribe=True, model_size=None):
+    """Generate synthetic clips and run the pipeline on each, with the LLM answered by the local stub"""
+    server, base_url = llm_stub.start_stub_server()
+    workdir = tempfile.mkdtemp(prefix="reelify-pipeline-bench-")
+    spawn = multiprocessing.get_context("spawn")
+    report = {'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                              'cpus': os.cpu_count(), 'render_backend': main.REEL_RENDER_BACKEND,
+                              'whisper_model': model_size or main.WHISPER_MODEL_SIZE},
+              'cases': {}}
+    try:
+        for resolution in resolutions:
+            width, height = (int(n) for n in resolution.lower().split('x'))
+            for seconds in lengths:
+                case = f"{width}x{height}@{seconds}s"
+                case_dir = os.path.join(workdir, case.replace('@', '_'))
+                os.makedirs(case_dir)
+                video_path = generate_synthetic_video(os.path.join(case_dir, "source.mp4"), width, height, seconds)
+                case_runs = []
+                for run in range(runs):
+                    run_dir = os.path.join(case_dir, f"run_{run}")
+                    os.makedirs(run_dir)
+                    # a fresh process per run, so peak RSS high-water marks belong to this clip alone
+                    with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                        case_runs.append(pool.submit(_pipeline_case_worker, video_path, run_dir, transcribe,
+                                                     model_size, base_url).result())
+                report['cases'][case] = _median_stage(case_runs)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def compare_to_baseline(report, baseline, tolerance=0.2, min_seconds=0.25):
+    """Regressions versus the baseline: a failed or missing case or stage, renders that failed, a stage's
+    throughput, or a clip's peak memory, off by more than tolerance.
+
+    Stages that took less than min_seconds in the baseline are too noisy to compare on throughput.
+    """
+    regressions = []
+    for case in baseline.get('cases', {}):
+        if case not in report['cases']:
+            regressions.append(f"{case}: missing from this run")
+    for case, stages in report['cases'].items():
+        base_stages = baseline.get('cases', {}).get(case, {})
+        for stage, base in base_stages.items():
+            if stage not in stages and 'error' not in base:
+                regressions.append(f"{case} {stage}: missing (the run stopped before it)")
+        for stage, row in stages.items():
+            base = base_stages.get(stage)
+            if not base or 'error' in base:
+                continue
+            if 'error' in row:
+                regressions.append(f"{case} {stage}: failed ({row['error']})")
+                continue
+            if len(row.get('failed', [])) > len(base.get('failed', [])):
+                regressions.append(f"{case} {stage}: {len(row['failed'])} item(s) failed ({row['failed'][0]})")
+            if (base.get('throughput') and row.get('throughput') is not None
+                    and base.get('wall_seconds', 0) >= min_seconds
+                    and row['throughput'] < base['throughput'] * (1 - tolerance)):
+                regressions.append(f"{case} {stage}: throughput {row['throughput']}x vs baseline {base['throughput']}x")
+        # high-water marks only grow within a run, so memory is compared per clip rather than per stage
+        for field in ('peak_rss_mb', 'child_peak_rss_mb'):
+            peak = max((row.get(field) or 0 for row in stages.values()), default=0)
+            base_peak = max((row.get(field) or 0 for row in base_stages.values()), default=0)
+            if base_peak and peak > base_peak * (1 + tolerance):
+                regressions.append(f"{case}: {field} {peak} vs baseline {base_peak}")
+    return regressions
+
+def print_pipeline_report(report):
+    print(f"{'case':<20} {'stage':<14} {'wall s':>8} {'x source':>9} {'cpu s':>7} {'child s':>8} {'peak MB':>8} {'child MB':>9}")
+    for case, stages in report['cases'].items():
+        for stage, row in stages.items():
+            if 'error' in row:
+                print(f"{case:<20} {stage:<14} failed: {row['error']}")
+                continue
+            cells = [f"{row.get(field, '-') if row.get(field) is not None else '-':>{width}}"
+                     for field, width in (('wall_seconds', 8), ('throughput', 9), ('cpu_seconds', 7),
+                                          ('child_cpu_seconds', 8), ('peak_rss_mb', 8), ('child_peak_rss_mb', 9))]
+            print(f"{case:<20} {stage:<14} {' '.join(cells)}")
+            for error in row.get('failed', []):
+                print(f"{'':<20} {'':<14} failed: {error}")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Reelify benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backends = subparsers.add_parser("backends", help="Compare reel render backends on one clip")
+    backends.add_argument("video")
+    backends.add_argument("--start", type=float, default=0)
+    backends.add_argument("--end", type=float, default=20)
+    backends.add_argument("--runs", type=int, default=3)
+    backends.add_argument("--preset")
+    backends.add_argument("--crf", type=int)
+
+    transcribe = subparsers.add_parser("transcribe", help="Wall time of chunked transcription vs chunk count")
+    transcribe.add_argument("media")
+    transcribe.add_argument("--chunks", type=int, nargs="+", default=[1, 2, 4, 8])
+    transcribe.add_argument("--workers", type=int)
+    transcribe.add_argument("--model")
+
+    db = subparsers.add_parser("db", help="Logins and history reads per second under concurrent threads")
+    db.add_argument("--threads", type=int, default=16)
+    db.add_argument("--seconds", type=float, default=5)
+    db.add_argument("--users", type=int, default=50)
+
+    pipeline = subparsers.add_parser("pipeline", help="End-to-end stage throughput and memory on synthetic clips")
+    pipeline.add_argument("--resolutions", nargs="+", default=["640x360", "1280x720", "1920x1080"])
+    pipeline.add_argument("--lengths", type=int, nargs="+", default=[30, 120], help="clip lengths in seconds")
+    pipeline.add_argument("--runs", type=int, default=1, help="runs per clip; the median is reported")
+    pipeline.add_argument("--model", help="Whisper model size for the transcribe stage")
+    pipeline.add_argument("--skip-transcribe", action="store_true")
+    pipeline.add_argument("--baseline", help="baseline JSON to compare against; exits 1 on regression")
+    pipeline.add_argument("--save-baseline", help="write this run's results to the given JSON file")
+    pipeline.add_argument("--tolerance", type=float, default=0.2,
+                          help="allowed fractional throughput drop or memory growth (default: 0.2)")
+    pipeline.add_argument("--min-seconds", type=float, default=0.25,
+                          help="skip throughput checks for stages faster than this in the baseline (default: 0.25)")
+
+    args = parser.parse_args(argv)
+    if args.command == "backends":
+        report = benchmark_render_backends(args.video, args.start, args.end, args.runs,
+                                           preset=args.preset, crf=args.crf)
+        print_backend_report(report)
+    elif args.command == "transcribe":
+        print_transcription_report(benchmark_transcription(args.media, args.chunks, args.workers, args.model))
+    elif args.command == "db":
+        print_database_report(benchmark_database(args.threads, args.seconds, args.users), args.threads)
+    elif args.command == "pipeline":
+        report = benchmark_pipeline(args.resolutions, args.lengths, args.runs, not args.skip_transcribe, args.model)
+        print_pipeline_report(report)
+        if args.save_baseline:
+            with open(args.save_baseline, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            if baseline.get('environment') != report['environment']:
+                print("warning: baseline was recorded in a different environment")
+            regressions = compare_to_baseline(report, baseline, args.tolerance, args.min_seconds)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            if regressions:
+                return 1
+            print("no regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
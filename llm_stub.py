@@ -0,0 +1,88 @@
+"""Minimal OpenAI-compatible chat completions endpoint for offline runs.
+
+Start it and point the app at it:
+    python llm_stub.py --port 8001
+    REELIFY_LLM_BASE_URL=http://127.0.0.1:8001/v1 streamlit run main.py
+
+Replies are deterministic: segment-ID prompts get evenly spaced [first ID] - [last ID]
+ranges, and timestamp prompts get evenly spaced [MM:SS] - [MM:SS] ranges.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stub_reply(prompt, highlights=3):
+    """Deterministic highlight answer for a Reelify prompt"""
+    copied = re.findall(r'^\s*(\[\d+\]\s*-\s*\[\d+\])', prompt, re.MULTILINE)
+    if copied:
+        return "\n".join(copied[:highlights])
+    ids = [int(m) for m in re.findall(r'^\s*(\d+)\|', prompt, re.MULTILINE)]
+    if ids:
+        step = max(1, len(ids) // highlights)
+        span = max(0, min(step, 5) - 1)
+        return "\n".join(f"[{ids[i]}] - [{ids[min(i + span, len(ids) - 1)]}]" for i in range(0, len(ids), step)[:highlights])
+    match = re.search(r'\(([\d.]+) seconds total\)', prompt)
+    duration = float(match.group(1)) if match else 60.0
+    lines = []
+    for i in range(highlights):
+        start = int(duration * i / highlights)
+        end = int(min(duration, start + 20))
+        lines.append(f"[{start // 60:02d}:{start % 60:02d}] - [{end // 60:02d}:{end % 60:02d}]")
+    return "\n".join(lines)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt = "\n".join(message.get('content', '') for message in body.get('messages', []))
+        content = stub_reply(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        payload = json.dumps({
+            'id': f"chatcmpl-stub-{int(time.time() * 1000)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                      'total_tokens': (len(prompt) + len(content)) // 4},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, latency=0.0):
+    """Serve the stub in a background thread; returns the server and its base URL"""
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for the OpenAI chat completions API")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each reply")
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, args.latency)
+    print(f"LLM stub listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
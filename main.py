@@ -2,7 +2,6 @@ import os
 import ffmpeg 
 import openai 
 import whisper 
-import tempfile 
 import streamlit as st 
 import re
 import zipfile
@@ -12,33 +11,148 @@ import gc
 import yt_dlp
 import sqlite3
 import bcrypt
+import threading
+import json
+import hashlib
+import uuid
+import bisect
+import asyncio
+import random
+import traceback
+import queue
+import atexit
+import hmac
+import sys
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+from contextlib import contextmanager
+import numpy as np
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from dotenv import load_dotenv 
 from moviepy.editor import VideoFileClip 
 
+import worker_jobs
+
 load_dotenv() 
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY")) 
+LLM_BASE_URL = os.getenv("REELIFY_LLM_BASE_URL") or None
 
 os.environ["PATH"] = r"C:\Users\dsaip\Downloads\ffmpeg-7.1.1-full_build\ffmpeg-7.1.1-full_build\bin" + os.pathsep + os.environ.get("PATH", "") 
 
-def init_database():
-    """Initialize SQLite database with users and history tables"""
-    conn = sqlite3.connect('reelify.db')
-    cursor = conn.cursor()
-    
+WHISPER_MODEL_SIZE = os.getenv("REELIFY_WHISPER_MODEL", "base")
+WHISPER_MEMORY_BUDGET_MB = float(os.getenv("REELIFY_WHISPER_MEMORY_MB", "2048"))
+WHISPER_WARMUP_MODELS = [m.strip() for m in os.getenv("REELIFY_WHISPER_WARMUP", "").split(",") if m.strip()]
+
+@st.cache_resource
+def _whisper_registry():
+    """Process-wide Whisper model registry shared by all sessions"""
+    return {
+        'models': OrderedDict(),
+        'lock': threading.Lock(),
+        'loading': {},
+        'stats': {'hits': 0, 'misses': 0, 'evictions': 0, 'load_seconds': {}},
+    }
+
+def _default_whisper_device():
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+def _model_size_mb(model):
+    try:
+        return sum(p.numel() * p.element_size() for p in model.parameters()) / (1024 * 1024)
+    except Exception:
+        return 0.0
+
+def _whisper_entry(size=None, device=None):
+    """Registry entry for a model, loading it at most once per key without blocking hits on other models"""
+    size = size or WHISPER_MODEL_SIZE
+    device = device or _default_whisper_device()
+    key = (size, device)
+    registry = _whisper_registry()
+    models = registry['models']
+    stats = registry['stats']
+    with registry['lock']:
+        if key in models:
+            models.move_to_end(key)
+            stats['hits'] += 1
+            return models[key]
+        load_lock = registry['loading'].setdefault(key, threading.Lock())
+    with load_lock:
+        with registry['lock']:
+            if key in models:
+                models.move_to_end(key)
+                stats['hits'] += 1
+                return models[key]
+            stats['misses'] += 1
+        start = time.perf_counter()
+        model = whisper.load_model(size, device=device)
+        entry = {'model': model, 'size_mb': _model_size_mb(model), 'lock': threading.Lock()}
+        with registry['lock']:
+            stats['load_seconds'][f"{size}@{device}"] = round(time.perf_counter() - start, 3)
+            models[key] = entry
+            registry['loading'].pop(key, None)
+            evicted = 0
+            while len(models) > 1 and sum(m['size_mb'] for m in models.values()) > WHISPER_MEMORY_BUDGET_MB:
+                models.popitem(last=False)
+                evicted += 1
+            stats['evictions'] += evicted
+        if evicted:
+            gc.collect()
+        return entry
+
+def get_whisper_model(size=None, device=None):
+    """Return a cached Whisper model, loading it lazily and evicting LRU models over budget"""
+    return _whisper_entry(size, device)['model']
+
+@contextmanager
+def use_whisper_model(size=None, device=None):
+    """Hold a cached model exclusively: Whisper's decoder installs KV-cache hooks on the shared modules per call"""
+    entry = _whisper_entry(size, device)
+    with entry['lock']:
+        yield entry['model']
+
+def warm_up_whisper_models(sizes=None):
+    """Preload the configured Whisper models so the first request doesn't pay the load time"""
+    registry = _whisper_registry()
+    device = _default_whisper_device()
+    for size in sizes if sizes is not None else WHISPER_WARMUP_MODELS:
+        if (size, device) not in registry['models']:
+            get_whisper_model(size, device)
+
+def whisper_model_stats():
+    """Snapshot of registry hit/miss counters, load times and resident models"""
+    registry = _whisper_registry()
+    with registry['lock']:
+        stats = dict(registry['stats'])
+        stats['load_seconds'] = dict(stats['load_seconds'])
+        stats['loaded'] = [
+            {'model': size, 'device': device, 'size_mb': round(entry['size_mb'], 1)}
+            for (size, device), entry in registry['models'].items()
+        ]
+    return stats
+
+DB_PATH = os.getenv("REELIFY_DB_PATH", "reelify.db")
+DB_POOL_SIZE = int(os.getenv("REELIFY_DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("REELIFY_DB_BUSY_TIMEOUT_MS", "30000"))
+HISTORY_FLUSH_SECONDS = float(os.getenv("REELIFY_HISTORY_FLUSH_SECONDS", "1"))
+HISTORY_BATCH_SIZE = int(os.getenv("REELIFY_HISTORY_BATCH_SIZE", "100"))
 
-    cursor.execute('''
+SCHEMA_MIGRATIONS = [
+    '''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             email TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
- 
-    cursor.execute('''
+        );
+
         CREATE TABLE IF NOT EXISTS processing_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
@@ -47,11 +161,118 @@ def init_database():
             reels_generated INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+        );
+
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            video_name TEXT,
+            source TEXT NOT NULL,
+            source_type TEXT NOT NULL,
+            state TEXT NOT NULL,
+            stage TEXT,
+            message TEXT,
+            progress REAL DEFAULT 0,
+            stage_timings TEXT,
+            result TEXT,
+            error TEXT,
+            workdir TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        );
+    ''',
+    '''
+        CREATE INDEX IF NOT EXISTS idx_history_user_created ON processing_history (user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs (user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state);
+    ''',
+    '''
+        ALTER TABLE processing_history ADD COLUMN job_id TEXT;
+
+        CREATE TABLE IF NOT EXISTS stage_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL,
+            user_id INTEGER,
+            stage TEXT NOT NULL,
+            item INTEGER,
+            wall_seconds REAL,
+            cpu_seconds REAL,
+            child_cpu_seconds REAL,
+            peak_rss_mb REAL,
+            child_peak_rss_mb REAL,
+            read_bytes INTEGER,
+            write_bytes INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (job_id) REFERENCES jobs (id)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_stage_metrics_job ON stage_metrics (job_id);
+        CREATE INDEX IF NOT EXISTS idx_stage_metrics_stage ON stage_metrics (stage, created_at);
+    ''',
+]
+
+def _open_connection():
+    # cached_statements keeps each connection's prepared statements for the fixed SQL strings below
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           cached_statements=256)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    return conn
+
+def migrate_database(conn):
+    """Apply schema migrations newer than the database's user_version"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, script in enumerate(SCHEMA_MIGRATIONS, 1):
+            if number > version:
+                for statement in script.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version={number}')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+@st.cache_resource
+def _db_pool():
+    """Process-wide pool of WAL-mode SQLite connections; migrates the schema once when created"""
+    conn = _open_connection()
+    conn.isolation_level = None
+    migrate_database(conn)
+    conn.isolation_level = ''
+    idle = queue.LifoQueue()
+    idle.put(conn)
+    return {'idle': idle, 'created': 1, 'lock': threading.Lock()}
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection, committing on success and rolling back on error"""
+    pool = _db_pool()
+    try:
+        conn = pool['idle'].get_nowait()
+    except queue.Empty:
+        with pool['lock']:
+            can_open = pool['created'] < DB_POOL_SIZE
+            if can_open:
+                pool['created'] += 1
+        conn = _open_connection() if can_open else pool['idle'].get()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool['idle'].put(conn)
+
+def init_database():
+    """Initialize SQLite database with users and history tables"""
+    _db_pool()
+    _history_writer()
 
 def hash_password(password):
     """Hash password using bcrypt"""
@@ -61,39 +282,39 @@ def verify_password(password, hashed):
     """Verify password against hash"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+SQL_FIND_EMAIL = 'SELECT email FROM users WHERE email = ?'
+SQL_INSERT_USER = 'INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)'
+SQL_FIND_USER = 'SELECT id, name, email, password_hash FROM users WHERE email = ?'
+SQL_INSERT_HISTORY = '''
+    INSERT INTO processing_history (user_id, video_name, video_duration, reels_generated, job_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+SQL_USER_HISTORY = '''
+    SELECT video_name, video_duration, reels_generated, created_at
+    FROM processing_history
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+    LIMIT 10
+'''
+
 def register_user(name, email, password):
     """Register a new user"""
     try:
-        conn = sqlite3.connect('reelify.db')
-        cursor = conn.cursor()
-        
-
-        cursor.execute('SELECT email FROM users WHERE email = ?', (email,))
-        if cursor.fetchone():
-            return False, "Email already registered"
-        
-
-        password_hash = hash_password(password)
-        cursor.execute('''
-            INSERT INTO users (name, email, password_hash)
-            VALUES (?, ?, ?)
-        ''', (name, email, password_hash))
-        
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            if conn.execute(SQL_FIND_EMAIL, (email,)).fetchone():
+                return False, "Email already registered"
+            conn.execute(SQL_INSERT_USER, (name, email, hash_password(password)))
         return True, "Registration successful"
+    except sqlite3.IntegrityError:
+        return False, "Email already registered"
     except Exception as e:
         return False, f"Registration failed: {str(e)}"
 
 def login_user(email, password):
     """Authenticate user login"""
     try:
-        conn = sqlite3.connect('reelify.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT id, name, email, password_hash FROM users WHERE email = ?', (email,))
-        user = cursor.fetchone()
-        conn.close()
+        with db_connection() as conn:
+            user = conn.execute(SQL_FIND_USER, (email,)).fetchone()
         
         if user and verify_password(password, user[3]):
             return True, {"id": user[0], "name": user[1], "email": user[2]}
@@ -102,43 +323,176 @@ def login_user(email, password):
     except Exception as e:
         return False, f"Login failed: {str(e)}"
 
-def save_processing_history(user_id, video_name, video_duration, reels_count):
-    """Save processing history to database"""
-    try:
-        conn = sqlite3.connect('reelify.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO processing_history (user_id, video_name, video_duration, reels_generated)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, video_name, video_duration, reels_count))
-        
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        st.error(f"Failed to save history: {str(e)}")
+@st.cache_resource
+def _history_writer():
+    """Background writer that batches processing-history inserts"""
+    writer = {'queue': queue.Queue(), 'lock': threading.Lock(), 'wake': threading.Event()}
+    threading.Thread(target=_history_writer_loop, args=(writer,), daemon=True, name="reelify-history").start()
+    atexit.register(flush_processing_history)
+    return writer
+
+def _history_writer_loop(writer):
+    while True:
+        writer['wake'].wait(HISTORY_FLUSH_SECONDS)
+        writer['wake'].clear()
+        if writer['queue'].empty():
+            continue
+        try:
+            flush_processing_history()
+        except Exception:
+            pass
+
+def flush_processing_history():
+    """Write all queued history rows in batched executemany calls"""
+    writer = _history_writer()
+    with writer['lock']:
+        while True:
+            batch = []
+            while len(batch) < HISTORY_BATCH_SIZE:
+                try:
+                    batch.append(writer['queue'].get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                with db_connection() as conn:
+                    conn.executemany(SQL_INSERT_HISTORY, batch)
+            except Exception:
+                for row in batch:
+                    writer['queue'].put(row)
+                raise
+
+def save_processing_history(user_id, video_name, video_duration, reels_count, job_id=None):
+    """Queue a processing history row; the background writer inserts queued rows in batches"""
+    writer = _history_writer()
+    writer['queue'].put((user_id, video_name, video_duration, reels_count, job_id))
+    if writer['queue'].qsize() >= HISTORY_BATCH_SIZE:
+        writer['wake'].set()
 
 def get_user_history(user_id):
     """Get user's processing history"""
     try:
-        conn = sqlite3.connect('reelify.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT video_name, video_duration, reels_generated, created_at
-            FROM processing_history 
-            WHERE user_id = ?
-            ORDER BY created_at DESC
-            LIMIT 10
-        ''', (user_id,))
-        
-        history = cursor.fetchall()
-        conn.close()
-        return history
+        flush_processing_history()
+        with db_connection() as conn:
+            return conn.execute(SQL_USER_HISTORY, (user_id,)).fetchall()
     except Exception as e:
         st.error(f"Failed to fetch history: {str(e)}")
         return []
 
+JOB_COLUMNS = ['id', 'user_id', 'video_name', 'source', 'source_type', 'state', 'stage', 'message', 'progress',
+               'stage_timings', 'result', 'error', 'workdir', 'created_at', 'updated_at']
+JOB_JSON_COLUMNS = ('stage_timings', 'result')
+ACTIVE_JOB_STATES = ('queued', 'running')
+
+def _job_from_row(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    for column in JOB_JSON_COLUMNS:
+        job[column] = json.loads(job[column]) if job[column] else {}
+    return job
+
+class JobLimitError(Exception):
+    """Raised when queuing a job would exceed the per-user or global active job limit"""
+
+def create_job(job_id, user_id, video_name, source, source_type, workdir, enforce_limits=False):
+    """Insert a queued processing job; with enforce_limits the limit check and the insert share one write lock"""
+    with db_connection() as conn:
+        if enforce_limits:
+            # BEGIN IMMEDIATE takes the write lock before counting, so parallel submissions can't both pass
+            conn.execute("BEGIN IMMEDIATE")
+            reason = _job_limit_reason(conn, user_id)
+            if reason:
+                raise JobLimitError(reason)
+        conn.execute('''
+            INSERT INTO jobs (id, user_id, video_name, source, source_type, state, message, workdir)
+            VALUES (?, ?, ?, ?, ?, 'queued', 'Waiting for a worker...', ?)
+        ''', (job_id, user_id, video_name, source, source_type, workdir))
+
+def update_job(job_id, **fields):
+    """Update job columns; dict values are stored as JSON"""
+    assignments = []
+    values = []
+    for column, value in fields.items():
+        if column not in JOB_COLUMNS:
+            raise ValueError(f"Unknown job column: {column}")
+        assignments.append(f"{column} = ?")
+        values.append(json.dumps(value, default=float) if column in JOB_JSON_COLUMNS else value)
+    with db_connection() as conn:
+        conn.execute(f"UPDATE jobs SET {', '.join(assignments)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                     (*values, job_id))
+
+def get_job(job_id):
+    with db_connection() as conn:
+        row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job_from_row(row) if row else None
+
+def get_user_jobs(user_id, limit=10):
+    """User's most recent jobs, newest first"""
+    with db_connection() as conn:
+        rows = conn.execute(f'''
+            SELECT {', '.join(JOB_COLUMNS)} FROM jobs
+            WHERE user_id = ?
+            ORDER BY created_at DESC, rowid DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+    return [_job_from_row(row) for row in rows]
+
+def count_active_jobs(user_id=None, conn=None):
+    """Queued and running jobs, for one user or for the whole host"""
+    placeholders = ', '.join('?' for _ in ACTIVE_JOB_STATES)
+    query = f"SELECT COUNT(*) FROM jobs WHERE state IN ({placeholders})"
+    params = list(ACTIVE_JOB_STATES)
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params.append(user_id)
+    if conn is not None:
+        return conn.execute(query, params).fetchone()[0]
+    with db_connection() as conn:
+        return conn.execute(query, params).fetchone()[0]
+
+def get_jobs_in_states(states):
+    placeholders = ', '.join('?' for _ in states)
+    with db_connection() as conn:
+        rows = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE state IN ({placeholders})",
+                            list(states)).fetchall()
+    return [_job_from_row(row) for row in rows]
+
+STAGE_METRIC_FIELDS = ('wall_seconds', 'cpu_seconds', 'child_cpu_seconds', 'peak_rss_mb', 'child_peak_rss_mb',
+                       'read_bytes', 'write_bytes')
+SQL_INSERT_STAGE_METRIC = f'''
+    INSERT INTO stage_metrics (job_id, user_id, stage, item, {', '.join(STAGE_METRIC_FIELDS)})
+    VALUES (?, ?, ?, ?, {', '.join('?' for _ in STAGE_METRIC_FIELDS)})
+'''
+
+def save_stage_metrics(job_id, user_id, trace):
+    """Persist a job's stage measurements, one row per stage (or per reel for per-reel stages)"""
+    rows = [(job_id, user_id, span['stage'], span.get('item'), *(span.get(field) for field in STAGE_METRIC_FIELDS))
+            for span in trace]
+    if rows:
+        with db_connection() as conn:
+            conn.executemany(SQL_INSERT_STAGE_METRIC, rows)
+
+def get_stage_metrics(job_id):
+    with db_connection() as conn:
+        rows = conn.execute(f"SELECT stage, item, {', '.join(STAGE_METRIC_FIELDS)} FROM stage_metrics "
+                            "WHERE job_id = ? ORDER BY id", (job_id,)).fetchall()
+    return [dict(zip(('stage', 'item') + STAGE_METRIC_FIELDS, row)) for row in rows]
+
+def get_stage_metric_totals(job_id=None):
+    """Per-stage run counts, summed times and bytes, and the largest peak RSS, for one job or all of them"""
+    query = '''
+        SELECT stage, COUNT(*), SUM(wall_seconds), SUM(cpu_seconds), SUM(child_cpu_seconds),
+               MAX(peak_rss_mb), MAX(child_peak_rss_mb), SUM(read_bytes), SUM(write_bytes)
+        FROM stage_metrics
+    '''
+    params = ()
+    if job_id:
+        query += " WHERE job_id = ?"
+        params = (job_id,)
+    with db_connection() as conn:
+        rows = conn.execute(query + " GROUP BY stage ORDER BY MIN(id)", params).fetchall()
+    return [dict(zip(('stage', 'runs') + STAGE_METRIC_FIELDS, row)) for row in rows]
+
 def show_auth_page():
     """Show authentication page (login/register)"""
     st.title("🎬 Smart Video Processor - Authentication")
@@ -243,7 +597,9 @@ def parse_timestamp(timestamp_str):
     except:
         return 0
 
-def extract_timestamps_from_gpt_response(gpt_response, max_duration=None):
+def extract_timestamps_from_gpt_response(gpt_response, max_duration=None, on_warning=None):
+    """Parse [MM:SS] - [MM:SS] ranges; segments past max_duration are dropped or trimmed and reported to on_warning"""
+    on_warning = on_warning or (lambda message: None)
     timestamps = []
     pattern = r'\[([^\]]+)\]\s*-\s*\[([^\]]+)\]'
     matches = re.findall(pattern, gpt_response)
@@ -253,68 +609,693 @@ def extract_timestamps_from_gpt_response(gpt_response, max_duration=None):
         if start_seconds < end_seconds:
             if max_duration:
                 if start_seconds >= max_duration:
-                    st.warning(f"⚠️ Skipping segment {start_str}-{end_str}: starts after video ends ({max_duration:.1f}s)")
+                    on_warning(f"⚠️ Skipping segment {start_str}-{end_str}: starts after video ends ({max_duration:.1f}s)")
                     continue
                 if end_seconds > max_duration:
-                    st.warning(f"⚠️ Adjusting end time for segment {start_str}-{end_str}: was beyond video duration")
+                    on_warning(f"⚠️ Adjusting end time for segment {start_str}-{end_str}: was beyond video duration")
                     end_seconds = max_duration
             timestamps.append((start_seconds, end_seconds))
     return timestamps
 
+PROBE_CACHE_SIZE = int(os.getenv("REELIFY_PROBE_CACHE_SIZE", "256"))
+AV_SYNC_TOLERANCE = float(os.getenv("REELIFY_AV_SYNC_TOLERANCE", "0.2"))
+BLACK_FRAME_MAX_RATIO = float(os.getenv("REELIFY_BLACK_FRAME_MAX_RATIO", "0.25"))
+# below this many bits per pixel per frame a reel may be mostly black, so blackdetect is run to find out
+BLACK_FRAME_SUSPECT_BPP = float(os.getenv("REELIFY_BLACK_FRAME_SUSPECT_BPP", "0.005"))
+
+@st.cache_resource
+def _probe_cache():
+    """Probe results keyed by (path, mtime, size), shared by every session in the process"""
+    return {'lock': threading.Lock(), 'entries': OrderedDict(), 'stats': {'hits': 0, 'misses': 0}}
+
+def _parse_frame_rate(rate):
+    try:
+        numerator, _, denominator = str(rate).partition('/')
+        value = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return value if value > 0 else None
+
+def _probe_number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+def _read_keyframes(media_path):
+    """Keyframe timestamps of the first video stream, read from packet flags without decoding"""
+    probe = ffmpeg.probe(media_path, select_streams='v:0', show_entries='packet=pts_time,flags')
+    return sorted({float(p['pts_time']) for p in probe.get('packets', [])
+                   if 'K' in p.get('flags', '') and p.get('pts_time') not in (None, 'N/A')})
+
+def probe_media(media_path, keyframes=False):
+    """Container and stream metadata from ffprobe, memoized per path, mtime and size.
+
+    With keyframes=True the video packet flags are also scanned (no decode) for keyframe timestamps.
+    Raises RuntimeError if the file can't be probed.
+    """
+    stat = os.stat(media_path)
+    key = (os.path.abspath(media_path), stat.st_mtime_ns, stat.st_size)
+    cache = _probe_cache()
+    with cache['lock']:
+        info = cache['entries'].get(key)
+        if info is not None and (info['keyframes'] is not None or not keyframes):
+            cache['entries'].move_to_end(key)
+            cache['stats']['hits'] += 1
+            return info
+        cache['stats']['misses'] += 1
+    if info is None:
+        try:
+            raw = ffmpeg.probe(media_path)
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"Could not probe {media_path}: {_ffmpeg_error_message(e)}") from e
+        streams = raw.get('streams', [])
+        container = raw.get('format', {})
+        video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+        stream_durations = [d for d in (_probe_number(s.get('duration')) for s in streams) if d]
+        info = {
+            'duration': _probe_number(container.get('duration')) or max(stream_durations, default=0.0),
+            'bit_rate': _probe_number(container.get('bit_rate'), int),
+            'format_name': container.get('format_name'),
+            'has_video': bool(video),
+            'has_audio': bool(audio),
+            'width': video.get('width'),
+            'height': video.get('height'),
+            'video_codec': video.get('codec_name'),
+            'pix_fmt': video.get('pix_fmt'),
+            'sample_aspect_ratio': video.get('sample_aspect_ratio', '1:1'),
+            'frame_rate_str': video.get('avg_frame_rate') if video.get('avg_frame_rate', '0/0') != '0/0' else None,
+            'frame_rate': _parse_frame_rate(video.get('avg_frame_rate')),
+            'video_bit_rate': _probe_number(video.get('bit_rate'), int),
+            'video_start': _probe_number(video.get('start_time')),
+            'video_duration': _probe_number(video.get('duration')),
+            'audio_codec': audio.get('codec_name'),
+            'audio_start': _probe_number(audio.get('start_time')),
+            'audio_duration': _probe_number(audio.get('duration')),
+            'video_codecs': [s.get('codec_name') for s in streams if s.get('codec_type') == 'video'],
+            'audio_codecs': [s.get('codec_name') for s in streams if s.get('codec_type') == 'audio'],
+            'keyframes': None,
+        }
+    if keyframes and info['keyframes'] is None:
+        info = dict(info, keyframes=_read_keyframes(media_path) if info['has_video'] else [])
+    with cache['lock']:
+        cache['entries'][key] = info
+        cache['entries'].move_to_end(key)
+        while len(cache['entries']) > PROBE_CACHE_SIZE:
+            cache['entries'].popitem(last=False)
+    return info
+
+def probe_cache_stats():
+    """Snapshot of the probe cache's hit/miss counters and entry count"""
+    cache = _probe_cache()
+    with cache['lock']:
+        return dict(cache['stats'], entries=len(cache['entries']))
+
+def black_frame_ratio(media_path, min_duration=0.1, pixel_threshold=0.10):
+    """Fraction of the video that ffmpeg's blackdetect filter reports as black; this decodes the file"""
+    duration = probe_media(media_path)['duration']
+    try:
+        _, err = run_ffmpeg_measured(
+            ffmpeg.input(media_path).video
+            .filter('blackdetect', d=min_duration, pix_th=pixel_threshold)
+            .output('-', format='null')
+        )
+    except ffmpeg.Error:
+        return None
+    log = err.decode('utf-8', errors='replace')
+    black = sum(float(x) for x in re.findall(r'black_duration:\s*([\d.]+)', log))
+    return min(1.0, black / duration) if duration else None
+
+TRANSCRIBE_WORKERS = int(os.getenv("REELIFY_TRANSCRIBE_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+TRANSCRIBE_CHUNK_SECONDS = float(os.getenv("REELIFY_TRANSCRIBE_CHUNK_SECONDS", "300"))
+WHISPER_SAMPLE_RATE = 16000
+AUDIO_MEMMAP_SECONDS = float(os.getenv("REELIFY_AUDIO_MEMMAP_SECONDS", "1800"))
+
+def load_audio_segment(media_path, start=0.0, end=None):
+    """Decode part of a file's audio to 16 kHz mono float32 samples over an ffmpeg pipe"""
+    input_args = {'ss': start}
+    if end is not None:
+        input_args['t'] = end - start
+    try:
+        out, _ = run_ffmpeg_measured(
+            ffmpeg.input(media_path, **input_args)
+            .output('pipe:', format='f32le', acodec='pcm_f32le', ac=1, ar=WHISPER_SAMPLE_RATE)
+        )
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"Failed to decode audio: {_ffmpeg_error_message(e)}") from e
+    return np.frombuffer(out, np.float32)
+
+def decode_audio(media_path, duration=None, workdir=None):
+    """16 kHz mono float32 samples for Whisper; very long inputs are decoded to a memory-mapped file"""
+    if workdir and duration and duration > AUDIO_MEMMAP_SECONDS:
+        raw_path = os.path.join(workdir, f"audio-{uuid.uuid4().hex}.f32")
+        try:
+            run_ffmpeg_measured(
+                ffmpeg.input(media_path)
+                .output(raw_path, format='f32le', acodec='pcm_f32le', ac=1, ar=WHISPER_SAMPLE_RATE)
+            )
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"Failed to decode audio: {_ffmpeg_error_message(e)}") from e
+        return np.memmap(raw_path, dtype=np.float32, mode='c')
+    return load_audio_segment(media_path)
+
+def create_audio_preview(media_path, preview_path):
+    """Small mono AAC copy of the soundtrack for the st.audio widget"""
+    try:
+        run_ffmpeg_measured(
+            ffmpeg.input(media_path)
+            .output(preview_path, vn=None, acodec='aac', ac=1, audio_bitrate='64k')
+            .overwrite_output()
+        )
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"Failed to extract audio: {_ffmpeg_error_message(e)}") from e
+    return preview_path
+
+def detect_silences(media_path, noise_db=-30, min_silence=0.5):
+    """(start, end) pairs of silent stretches reported by ffmpeg's silencedetect filter"""
+    try:
+        _, err = run_ffmpeg_measured(
+            ffmpeg.input(media_path).audio
+            .filter('silencedetect', n=f"{noise_db}dB", d=min_silence)
+            .output('-', format='null')
+        )
+    except ffmpeg.Error:
+        return []
+    log = err.decode('utf-8', errors='replace')
+    starts = [float(x) for x in re.findall(r'silence_start: (-?[\d.]+)', log)]
+    ends = [float(x) for x in re.findall(r'silence_end: (-?[\d.]+)', log)]
+    return list(zip(starts, ends))
+
+def plan_transcription_chunks(duration, silences, chunk_seconds=None):
+    """Split [0, duration] into roughly chunk_seconds pieces, cutting in the middle of a nearby silence"""
+    chunk_seconds = chunk_seconds or TRANSCRIBE_CHUNK_SECONDS
+    cut_points = [(start + end) / 2 for start, end in silences]
+    chunks = []
+    chunk_start = 0.0
+    while duration - chunk_start > chunk_seconds * 1.25:
+        target = chunk_start + chunk_seconds
+        window = [c for c in cut_points if abs(c - target) <= chunk_seconds * 0.25]
+        cut = min(window, key=lambda c: abs(c - target)) if window else target
+        chunks.append((chunk_start, cut))
+        chunk_start = cut
+    chunks.append((chunk_start, duration))
+    return chunks
+
+def stitch_transcript_chunks(chunks):
+    """Merge per-chunk results (in any order) into one Whisper-style result"""
+    chunks = sorted(chunks, key=lambda chunk: chunk['index'])
+    segments = []
+    for chunk in chunks:
+        for segment in chunk['segments']:
+            segments.append(dict(segment, id=len(segments)))
+    return {
+        'text': ' '.join(chunk['text'] for chunk in chunks if chunk['text']),
+        'segments': segments,
+        'language': next((chunk['language'] for chunk in chunks if chunk['language']), None),
+    }
+
+def transcribe_in_chunks(duration, workers=None, chunk_seconds=None):
+    """Whether transcribe_media will split this duration across worker processes"""
+    workers = workers or TRANSCRIBE_WORKERS
+    chunk_seconds = chunk_seconds or TRANSCRIBE_CHUNK_SECONDS
+    return workers > 1 and duration > chunk_seconds * 1.25 and _default_whisper_device() == "cpu"
+
+def transcribe_media(media_path, duration, model_size=None, workers=None, chunk_seconds=None, on_chunk=None,
+                     workdir=None, samples=None):
+    """Transcribe a file's audio, decoded straight from the media, in parallel chunks when it is long.
+
+    samples, already decoded by decode_audio, are used instead of decoding again on the single-process path.
+    """
+    model_size = model_size or WHISPER_MODEL_SIZE
+    workers = workers or TRANSCRIBE_WORKERS
+    chunk_seconds = chunk_seconds or TRANSCRIBE_CHUNK_SECONDS
+    if not transcribe_in_chunks(duration, workers, chunk_seconds):
+        audio = samples if samples is not None else decode_audio(media_path, duration, workdir)
+        with use_whisper_model(model_size) as model:
+            return model.transcribe(audio)
+    chunks = plan_transcription_chunks(duration, detect_silences(media_path), chunk_seconds)
+    jobs = [{'index': i, 'media_path': media_path, 'start': start, 'end': end, 'model_size': model_size}
+            for i, (start, end) in enumerate(chunks)]
+    finished = []
+    workers = min(workers, len(jobs))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=PROCESS_POOL_CONTEXT,
+                             initializer=worker_jobs.init_transcription_worker,
+                             initargs=(model_size, max(1, (os.cpu_count() or 1) // workers))) as pool:
+        for future in as_completed([pool.submit(worker_jobs.transcribe_chunk, job) for job in jobs]):
+            finished.append(future.result())
+            charge_stage_metrics(finished[-1]['metrics'], worker_process=True)
+            if on_chunk:
+                on_chunk(len(finished), len(jobs), stitch_transcript_chunks(finished))
+    return stitch_transcript_chunks(finished)
+
+SENTENCE_ENDINGS = ('.', '!', '?', '…')
+
+def build_transcript(whisper_result):
+    """Compact transcript from Whisper segments: parallel start/end arrays plus the segment texts"""
+    transcript = {'starts': array('d'), 'ends': array('d'), 'texts': []}
+    for segment in whisper_result.get('segments') or []:
+        text = (segment.get('text') or '').strip()
+        if not text:
+            continue
+        transcript['starts'].append(float(segment['start']))
+        transcript['ends'].append(float(segment['end']))
+        transcript['texts'].append(text)
+    return transcript
+
+def transcript_segment_at(transcript, seconds):
+    """Index of the segment playing at the given time (the nearest earlier one between segments)"""
+    index = bisect.bisect_right(transcript['starts'], seconds) - 1
+    return min(max(index, 0), len(transcript['texts']) - 1)
+
+def snap_to_sentence_boundaries(transcript, start_index, end_index, max_duration=30):
+    """Widen a run of segments so it starts and ends on sentence boundaries without exceeding max_duration.
+
+    A run longer than max_duration is first cut back to the last sentence end that fits, or to the last segment
+    that fits when no sentence ends in time.
+    """
+    starts, ends, texts = transcript['starts'], transcript['ends'], transcript['texts']
+    if ends[end_index] - starts[start_index] > max_duration:
+        fitting = start_index
+        while fitting < end_index and ends[fitting + 1] - starts[start_index] <= max_duration:
+            fitting += 1
+        end_index = next((i for i in range(fitting, start_index - 1, -1) if texts[i].endswith(SENTENCE_ENDINGS)),
+                         fitting)
+    while (start_index > 0 and not texts[start_index - 1].endswith(SENTENCE_ENDINGS)
+           and ends[end_index] - starts[start_index - 1] <= max_duration):
+        start_index -= 1
+    while (end_index < len(texts) - 1 and not texts[end_index].endswith(SENTENCE_ENDINGS)
+           and ends[end_index + 1] - starts[start_index] <= max_duration):
+        end_index += 1
+    return starts[start_index], ends[end_index]
+
+def format_transcript_for_prompt(transcript, indices=None):
+    """One line per segment as ID|start second|text, so GPT can answer with segment IDs"""
+    if indices is None:
+        indices = range(len(transcript['texts']))
+    return "\n".join(f"{i}|{int(transcript['starts'][i])}|{transcript['texts'][i]}" for i in indices)
+
+def segment_id_ranges(gpt_response, segment_count):
+    """[first ID] - [last ID] pairs from a reply, dropping IDs outside the transcript and reversed ranges"""
+    ranges = []
+    for first_str, last_str in re.findall(r'\[(\d+)\]\s*-\s*\[(\d+)\]', gpt_response):
+        first, last = int(first_str), int(last_str)
+        if first <= last < segment_count:
+            ranges.append((first, last))
+    return ranges
+
+def extract_segments_from_gpt_response(gpt_response, transcript, max_duration=30):
+    """Map [first ID] - [last ID] highlights back to sentence-aligned (start, end) times"""
+    timestamps = []
+    for first, last in segment_id_ranges(gpt_response, len(transcript['texts'])):
+        segment = snap_to_sentence_boundaries(transcript, first, last, max_duration)
+        if segment not in timestamps:
+            timestamps.append(segment)
+    return timestamps
+
+PRESCORE_WINDOW_SECONDS = int(os.getenv("REELIFY_PRESCORE_WINDOW_SECONDS", "30"))
+PRESCORE_HOP_SECONDS = int(os.getenv("REELIFY_PRESCORE_HOP_SECONDS", "5"))
+PRESCORE_TOP_N = int(os.getenv("REELIFY_PRESCORE_TOP_N", "8"))
+# transcripts of videos shorter than this are sent to the LLM whole; pre-scoring then only serves as the fallback
+PRESCORE_MIN_SECONDS = float(os.getenv("REELIFY_PRESCORE_MIN_SECONDS", "600"))
+SCENE_DETECT = os.getenv("REELIFY_SCENE_DETECT", "1") == "1"
+SCENE_THRESHOLD = float(os.getenv("REELIFY_SCENE_THRESHOLD", "0.3"))
+PRESCORE_WEIGHTS = {'loudness': 0.4, 'speech_rate': 0.4, 'scene_cuts': 0.2}
+
+def audio_loudness_envelope(samples, bin_seconds=1.0, sample_rate=WHISPER_SAMPLE_RATE):
+    """RMS loudness in dBFS per bin of decoded mono samples, a minute at a time so memory-mapped audio stays paged out"""
+    frame = int(sample_rate * bin_seconds)
+    levels = []
+    for offset in range(0, len(samples), frame * 60):
+        block = np.asarray(samples[offset:offset + frame * 60], dtype=np.float32)
+        full = len(block) // frame * frame
+        if full:
+            levels.append(np.sqrt(np.mean(np.square(block[:full].reshape(-1, frame)), axis=1)))
+        if len(block) > full:
+            levels.append(np.sqrt(np.mean(np.square(block[full:]), keepdims=True)))
+    rms = np.concatenate(levels) if levels else np.zeros(0, dtype=np.float32)
+    return np.clip(20 * np.log10(np.maximum(rms, 1e-6)), -60.0, 0.0)
+
+def speech_rate_envelope(transcript, bins, bin_seconds=1.0):
+    """Words per bin, each segment's words spread evenly over the bins it spans"""
+    rate = np.zeros(bins)
+    if not transcript['texts'] or not bins:
+        return rate
+    starts = np.frombuffer(transcript['starts'], dtype=np.float64)
+    ends = np.maximum(np.frombuffer(transcript['ends'], dtype=np.float64), starts + bin_seconds)
+    words = np.fromiter((len(text.split()) for text in transcript['texts']), dtype=np.float64,
+                        count=len(transcript['texts']))
+    first = np.clip((starts // bin_seconds).astype(int), 0, bins - 1)
+    last = np.clip((ends // bin_seconds).astype(int), 0, bins - 1)
+    per_bin = words / (last - first + 1)
+    # difference array: add each segment's rate at its first bin and remove it after its last
+    delta = np.zeros(bins + 1)
+    np.add.at(delta, first, per_bin)
+    np.add.at(delta, last + 1, -per_bin)
+    return np.cumsum(delta)[:bins] / bin_seconds
+
+def scene_cut_times(video_path, threshold=None):
+    """Timestamps where ffmpeg's scene score exceeds the threshold, measured on a downscaled decode"""
+    threshold = SCENE_THRESHOLD if threshold is None else threshold
+    try:
+        _, err = run_ffmpeg_measured(
+            ffmpeg.input(video_path).video
+            .filter('scale', 160, -2)
+            .filter('select', f"gt(scene,{threshold})")
+            .filter('showinfo')
+            .output('-', format='null')
+        )
+    except ffmpeg.Error:
+        return []
+    return [float(x) for x in re.findall(r'pts_time:\s*([\d.]+)', err.decode('utf-8', errors='replace'))]
+
+def _zscore(values):
+    spread = values.std()
+    return (values - values.mean()) / spread if spread > 0 else np.zeros_like(values)
+
+def _fit_bins(values, bins, fill):
+    fitted = np.full(bins, fill, dtype=np.float64)
+    fitted[:min(bins, len(values))] = values[:bins]
+    return fitted
+
+def score_highlight_windows(duration, loudness, speech_rate, scene_cuts, window=None, hop=None, top_n=None):
+    """Rank non-overlapping windows by a weighted z-score of loudness, speech rate and scene-cut density"""
+    window = window or PRESCORE_WINDOW_SECONDS
+    hop = hop or PRESCORE_HOP_SECONDS
+    top_n = top_n or PRESCORE_TOP_N
+    bins = max(1, int(np.ceil(duration)))
+    cuts = np.bincount(np.clip(np.asarray(scene_cuts, dtype=int), 0, bins - 1), minlength=bins).astype(np.float64)
+    features = {
+        # audio shorter than the duration counts as silence rather than wrapping the opening seconds around
+        'loudness': _fit_bins(loudness, bins, -60.0),
+        'speech_rate': _fit_bins(speech_rate, bins, 0.0),
+        'scene_cuts': cuts,
+    }
+    starts = np.arange(0, max(bins - window, 0) + 1, hop)
+    ends = np.minimum(starts + window, bins)
+    window_means = {}
+    for name, values in features.items():
+        cumulative = np.concatenate(([0.0], np.cumsum(values)))
+        window_means[name] = (cumulative[ends] - cumulative[starts]) / (ends - starts)
+    score = sum(PRESCORE_WEIGHTS[name] * _zscore(means) for name, means in window_means.items())
+    candidates = []
+    for index in np.argsort(-score, kind='stable'):
+        start = int(starts[index])
+        if any(abs(start - other['start']) < window for other in candidates):
+            continue
+        candidates.append({
+            'start': float(start),
+            'end': float(min(ends[index], duration)),
+            'score': round(float(score[index]), 3),
+            'loudness_db': round(float(window_means['loudness'][index]), 1),
+            'words_per_second': round(float(window_means['speech_rate'][index]), 2),
+            'scene_cuts': int(round(window_means['scene_cuts'][index] * (ends[index] - starts[index]))),
+        })
+        if len(candidates) >= top_n:
+            break
+    return candidates
+
+def prescore_highlight_windows(audio_path, transcript, duration, video_path=None, samples=None, workdir=None):
+    """Ranked candidate windows from local signals; scene cuts are skipped when no video is available.
+
+    samples from decode_audio are reused when given, so the audio isn't decoded a second time.
+    """
+    if samples is None:
+        samples = decode_audio(audio_path, duration, workdir)
+    loudness = audio_loudness_envelope(samples)
+    speech_rate = speech_rate_envelope(transcript, max(1, int(np.ceil(duration))))
+    scene_cuts = scene_cut_times(video_path) if video_path and SCENE_DETECT else []
+    return score_highlight_windows(duration, loudness, speech_rate, scene_cuts)
+
+def candidate_segment_indices(transcript, candidates):
+    """Sorted IDs of the transcript segments overlapping any candidate window"""
+    indices = set()
+    starts = transcript['starts']
+    for candidate in candidates:
+        first = transcript_segment_at(transcript, candidate['start'])
+        last = max(first, bisect.bisect_left(starts, candidate['end']) - 1)
+        indices.update(range(first, last + 1))
+    return sorted(indices)
+
+def timestamps_from_candidates(candidates, transcript, count=3, max_duration=30):
+    """Offline highlights: the best-scored windows, sentence-aligned when a transcript is available"""
+    timestamps = []
+    for candidate in candidates[:count]:
+        end = min(candidate['end'], candidate['start'] + max_duration)
+        if transcript['texts']:
+            starts, ends = transcript['starts'], transcript['ends']
+            first = transcript_segment_at(transcript, candidate['start'])
+            if ends[first] <= candidate['start'] and first < len(starts) - 1:
+                first += 1
+            last = max(first, transcript_segment_at(transcript, end - 0.01))
+            while last > first and ends[last] - starts[first] > max_duration:
+                last -= 1
+            segment = snap_to_sentence_boundaries(transcript, first, last, max_duration)
+        else:
+            segment = (candidate['start'], end)
+        if segment not in timestamps:
+            timestamps.append(segment)
+    return timestamps
+
+MEDIA_STORE_DIR = os.getenv("REELIFY_MEDIA_DIR", "reelify_media")
+INGEST_WORKERS = int(os.getenv("REELIFY_INGEST_WORKERS", "2"))
+INGEST_AUDIO_FIRST = os.getenv("REELIFY_INGEST_AUDIO_FIRST", "1") == "1"
+MEDIA_STORE_MAX_MB = float(os.getenv("REELIFY_MEDIA_MAX_MB", "20480"))
+MEDIA_PART_STALE_SECONDS = float(os.getenv("REELIFY_MEDIA_PART_STALE_SECONDS", "86400"))
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'opus', 'alac', 'ac3'}
+
+@st.cache_resource
+def _ingest_state():
+    """Download pool plus the in-flight downloads per media store entry, so concurrent jobs share them"""
+    return {
+        'executor': ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="reelify-ingest"),
+        'inflight': {},
+        'lock': threading.Lock(),
+    }
+
+def _media_store_dir(info):
+    key = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{info.get('extractor_key') or info.get('ie_key') or 'media'}_{info['id']}")
+    return os.path.join(MEDIA_STORE_DIR, key)
+
+def _ydl_options(store_dir, name, format_spec):
+    return {
+        'format': format_spec,
+        'outtmpl': os.path.join(store_dir, f'{name}.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        # keep .part files in the persistent store so interrupted downloads resume
+        'continuedl': True,
+        'nopart': False,
+        'retries': 10,
+        'fragment_retries': 10,
+    }
+
+def _download_with_info(info, store_dir, name, format_spec):
+    """Run the download for already-extracted info and return the written file path"""
+    with yt_dlp.YoutubeDL(_ydl_options(store_dir, name, format_spec)) as ydl:
+        result = ydl.process_ie_result(dict(info), download=True)
+        downloads = result.get('requested_downloads') or []
+        path = downloads[0].get('filepath') if downloads else ydl.prepare_filename(result)
+    if not path or not os.path.exists(path):
+        raise RuntimeError("Download finished but the file was not found")
+    return path
+
+def _mp4_compatible(path):
+    try:
+        info = probe_media(path)
+    except Exception:
+        return False
+    return (bool(info['video_codecs']) and all(c in MP4_VIDEO_CODECS for c in info['video_codecs'])
+            and all(c in MP4_AUDIO_CODECS for c in info['audio_codecs']))
+
+def normalize_to_mp4(path, target_path):
+    """Remux into MP4 with stream copy when the codecs allow it, re-encoding only when they don't"""
+    if os.path.splitext(path)[1].lower() == '.mp4':
+        os.replace(path, target_path)
+        return target_path
+    staging = f"{target_path}.tmp.mp4"
+    if _mp4_compatible(path):
+        options = {'c': 'copy', 'movflags': '+faststart'}
+    else:
+        options = {'vcodec': 'libx264', 'acodec': 'aac', 'pix_fmt': 'yuv420p', 'movflags': '+faststart'}
+    try:
+        run_ffmpeg_measured(ffmpeg.input(path).output(staging, **options).overwrite_output())
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"Failed to convert video to MP4: {_ffmpeg_error_message(e)}") from e
+    os.replace(staging, target_path)
+    os.remove(path)
+    return target_path
+
+def _fetch_video(info, store_dir):
+    video_path = os.path.join(store_dir, "video.mp4")
+    if not os.path.exists(video_path):
+        downloaded = _download_with_info(info, store_dir, "source", 'best[ext=mp4]/best')
+        normalize_to_mp4(downloaded, video_path)
+        evict_media_store(keep=store_dir)
+    return video_path
+
+def _media_store_busy(state):
+    return {store_dir for (store_dir, _), future in state['inflight'].items() if not future.done()}
+
+def _media_store_entries(busy=()):
+    """(last used, store dir, bytes) for every store entry not being fetched, dropping its stale partial downloads"""
+    entries = []
+    cutoff = time.time() - MEDIA_PART_STALE_SECONDS
+    for name in os.listdir(MEDIA_STORE_DIR):
+        store_dir = os.path.join(MEDIA_STORE_DIR, name)
+        if not os.path.isdir(store_dir) or store_dir in busy:
+            continue
+        for part in os.listdir(store_dir):
+            path = os.path.join(store_dir, part)
+            if part.endswith(('.part', '.ytdl')) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        entries.append((os.path.getmtime(store_dir), store_dir, _dir_size(store_dir)))
+    return entries
+
+def _remove_media_store_entry(state, store_dir):
+    """Delete one store entry; the caller holds the ingest lock"""
+    # jobs hold hard links or copies of the files, so removing the store entry doesn't break them
+    shutil.rmtree(store_dir, ignore_errors=True)
+    for kind in ('video', 'audio'):
+        state['inflight'].pop((store_dir, kind), None)
+
+def evict_media_store(max_mb=None, keep=None):
+    """Drop stale partial downloads, then least recently used store entries until the store fits its size cap"""
+    max_bytes = (MEDIA_STORE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    if not os.path.isdir(MEDIA_STORE_DIR):
+        return
+    state = _ingest_state()
+    with state['lock']:
+        entries = _media_store_entries(_media_store_busy(state))
+        total = sum(size for _, _, size in entries)
+        for _, store_dir, size in sorted(entries):
+            if total <= max_bytes:
+                break
+            if store_dir == keep:
+                continue
+            _remove_media_store_entry(state, store_dir)
+            total -= size
+
+def _shared_fetch(state, store_dir, kind, fetch, info):
+    """Run fetch in this thread unless another job is already fetching the same file, then wait for its result"""
+    with state['lock']:
+        future = state['inflight'].get((store_dir, kind))
+        owner = future is None or (future.done() and future.exception() is not None)
+        if owner:
+            future = Future()
+            state['inflight'][(store_dir, kind)] = future
+    if owner:
+        try:
+            future.set_result(fetch(info, store_dir))
+        except Exception as e:
+            future.set_exception(e)
+    return future.result()
+
+def _fetch_audio(info, store_dir):
+    for name in os.listdir(store_dir):
+        if name.startswith("audio.") and not name.endswith(('.part', '.ytdl')):
+            return os.path.join(store_dir, name)
+    audio_path = _download_with_info(info, store_dir, "audio", 'bestaudio/best')
+    evict_media_store(keep=store_dir)
+    return audio_path
+
+def ingest_youtube_video(url, audio_first=None):
+    """Extract metadata once, then fetch the media into the persistent store keyed by video ID.
+
+    Returns a dict with the title, duration, the audio-only file (when audio_first, so transcription can
+    start early) and a Future for the MP4 video. Media already in the store is returned without downloading.
+    """
+    audio_first = INGEST_AUDIO_FIRST if audio_first is None else audio_first
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        if info.get('_type') in ('url', 'url_transparent'):
+            info = ydl.extract_info(info['url'], download=False, process=False)
+    store_dir = _media_store_dir(info)
+    os.makedirs(store_dir, exist_ok=True)
+    os.utime(store_dir)
+    metadata_path = os.path.join(store_dir, "info.json")
+    if not os.path.exists(metadata_path):
+        with open(metadata_path, 'w', encoding='utf-8') as f:
+            json.dump({'id': info['id'], 'title': info.get('title'), 'duration': info.get('duration'),
+                       'webpage_url': info.get('webpage_url') or url}, f)
+
+    state = _ingest_state()
+    with state['lock']:
+        video_future = state['inflight'].get((store_dir, 'video'))
+        if video_future is None or (video_future.done() and video_future.exception()):
+            video_future = state['executor'].submit(_fetch_video, info, store_dir)
+            state['inflight'][(store_dir, 'video')] = video_future
+    audio_path = None
+    if audio_first and not os.path.exists(os.path.join(store_dir, "video.mp4")):
+        try:
+            # shared like the video, so two jobs for one URL never write the same .part file at once
+            audio_path = _shared_fetch(state, store_dir, 'audio', _fetch_audio, info)
+        except Exception:
+            audio_path = None
+    return {
+        'id': info['id'],
+        'title': info.get('title') or 'video',
+        'duration': info.get('duration'),
+        'store_dir': store_dir,
+        'audio_path': audio_path,
+        'video': video_future,
+    }
+
 def download_youtube_video(url, output_dir):
     """Download YouTube video using yt-dlp"""
     try:
-        ydl_opts = {
-            'format': 'best[ext=mp4]/best',
-            'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            title = info.get('title', 'video')
-            
-            safe_title = re.sub(r'[<>:"/\\|?*]', '_', title)
-            video_path = os.path.join(output_dir, f"{safe_title}.mp4")
-            
-            ydl_opts['outtmpl'] = video_path
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl_download:
-                ydl_download.download([url])
-                
-            for file in os.listdir(output_dir):
-                if safe_title in file and file.endswith(('.mp4', '.mkv', '.webm')):
-                    actual_path = os.path.join(output_dir, file)
-                    if actual_path != video_path and file.endswith('.mp4'):
-                        return actual_path
-                    elif not file.endswith('.mp4'):
-                        mp4_path = os.path.join(output_dir, f"{safe_title}.mp4")
-                        ffmpeg.input(actual_path).output(mp4_path).run(overwrite_output=True, quiet=True)
-                        os.remove(actual_path)
-                        return mp4_path
-                        
-            return video_path if os.path.exists(video_path) else None
-            
+        ingest = ingest_youtube_video(url, audio_first=False)
+        safe_title = re.sub(r'[<>:"/\\|?*]', '_', ingest['title'])
+        return _link_or_copy(ingest['video'].result(), os.path.join(output_dir, f"{safe_title}.mp4"))
     except Exception as e:
         raise Exception(f"Failed to download video: {str(e)}")
 
-def create_reel(input_video_path, start_time, end_time, output_path, max_duration=30, video_duration=None):
+REEL_RENDER_BACKEND = os.getenv("REELIFY_RENDER_BACKEND", "moviepy")
+REEL_ENCODER_PRESET = os.getenv("REELIFY_ENCODER_PRESET", "veryfast")
+REEL_ENCODER_CRF = int(os.getenv("REELIFY_ENCODER_CRF", "23"))
+REEL_WIDTH, REEL_HEIGHT = 1080, 1920
+REEL_BATCH_RENDER = os.getenv("REELIFY_BATCH_RENDER", "1") == "1"
+REEL_BATCH_MAX_GAP = float(os.getenv("REELIFY_BATCH_MAX_GAP_SECONDS", "60"))
+REEL_RENDER_WORKERS = int(os.getenv("REELIFY_RENDER_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+REEL_ENCODER_THREADS = int(os.getenv("REELIFY_ENCODER_THREADS", "0"))
+REEL_STREAM_COPY = os.getenv("REELIFY_STREAM_COPY", "1") == "1"
+STREAM_COPY_TOLERANCE = float(os.getenv("REELIFY_STREAM_COPY_TOLERANCE", "1.0"))
+# worker pools are started from the threaded Streamlit server, where a forked child can inherit locks held by
+# other threads (or torch/OpenMP state) and hang; spawned workers start from a clean interpreter instead
+PROCESS_POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+def encoder_threads_per_job(workers, encoders=1):
+    """Threads each encoder may use so that concurrent encodes (workers x encoders each) don't oversubscribe the CPU"""
+    if REEL_ENCODER_THREADS > 0:
+        return REEL_ENCODER_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, workers * encoders))
+
+def temp_audio_path_for(output_path):
+    """Unique MoviePy temp-audio file next to the reel, so concurrent renders never collide"""
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), f"temp-audio-{uuid.uuid4().hex}.m4a")
+
+def clamp_reel_segment(start_time, end_time, max_duration=30, video_duration=None):
+    """Clamp a highlight to the video and reel length limits, raising ValueError if unusable"""
+    if video_duration:
+        if start_time >= video_duration:
+            raise ValueError("Start time is beyond video duration")
+        if end_time > video_duration:
+            end_time = video_duration
+    duration = end_time - start_time
+    if duration > max_duration:
+        end_time = start_time + max_duration
+    if duration < 1:
+        raise ValueError("Segment too short")
+    return start_time, end_time
+
+def _render_reel_moviepy(input_video_path, start_time, end_time, output_path, threads=None, temp_audio_path=None):
     clip = clip_resized = clip_final = None
+    temp_audio = temp_audio_path or temp_audio_path_for(output_path)
     try:
-        if video_duration:
-            if start_time >= video_duration:
-                raise ValueError("Start time is beyond video duration")
-            if end_time > video_duration:
-                end_time = video_duration
-        duration = end_time - start_time
-        if duration > max_duration:
-            end_time = start_time + max_duration
-        if duration < 1:
-            raise ValueError("Segment too short")
         clip = VideoFileClip(input_video_path).subclip(start_time, end_time)
         original_width, original_height = clip.size
-        target_width, target_height = 1080, 1920
+        target_width, target_height = REEL_WIDTH, REEL_HEIGHT
         scale = min(target_width / original_width, target_height / original_height)
         new_width, new_height = int(original_width * scale), int(original_height * scale)
         clip_resized = clip.resize((new_width, new_height))
@@ -326,14 +1307,14 @@ def create_reel(input_video_path, start_time, end_time, output_path, max_duratio
             )
         else:
             clip_final = clip_resized
-        temp_audio = f'temp-audio-{int(time.time())}.m4a'
-        clip_final.write_videofile(output_path, codec='libx264', audio_codec='aac',
+        clip_final.write_videofile(output_path, codec='libx264', audio_codec='aac', threads=threads,
                                    temp_audiofile=temp_audio, remove_temp=True, verbose=False, logger=None)
-        return True
-    except Exception as e:
-        st.error(f"❌ Error creating reel: {e}")
-        return False
     finally:
+        if os.path.exists(temp_audio):
+            try:
+                os.remove(temp_audio)
+            except OSError:
+                pass
         for clip_obj in [clip_final, clip_resized, clip]:
             try:
                 if clip_obj:
@@ -343,10 +1324,481 @@ def create_reel(input_video_path, start_time, end_time, output_path, max_duratio
                 pass
         gc.collect()
 
-def evaluate_reel_quality(reel_path, expected_start, expected_end, transcript_segment=""):
-    quality_report = {'duration_check': False, 'resolution_check': False,
+def _fit_to_reel(video, width=REEL_WIDTH, height=REEL_HEIGHT):
+    """Scale a video stream to fit the reel frame and pad the rest with black"""
+    return (
+        video
+        .filter('scale', width, height, force_original_aspect_ratio='decrease')
+        .filter('pad', width, height, '(ow-iw)/2', '(oh-ih)/2', color='black')
+        .filter('setsar', 1)
+    )
+
+def _ffmpeg_error_message(error):
+    stderr = (error.stderr or b'').decode('utf-8', errors='replace').strip()
+    return stderr.splitlines()[-1] if stderr else str(error)
+
+def _reel_encode_options(preset=None, crf=None, threads=None):
+    options = {
+        'vcodec': 'libx264', 'acodec': 'aac', 'pix_fmt': 'yuv420p',
+        'preset': preset or REEL_ENCODER_PRESET,
+        'crf': REEL_ENCODER_CRF if crf is None else crf,
+        'movflags': '+faststart',
+    }
+    if threads:
+        options['threads'] = threads
+    return options
+
+def _render_reel_ffmpeg(input_video_path, start_time, end_time, output_path, preset=None, crf=None, threads=None):
+    source = ffmpeg.input(input_video_path, ss=start_time, t=end_time - start_time)
+    try:
+        run_ffmpeg_measured(
+            ffmpeg
+            .output(_fit_to_reel(source.video), source['a?'], output_path, **_reel_encode_options(preset, crf, threads))
+            .overwrite_output()
+        )
+    except ffmpeg.Error as e:
+        raise RuntimeError(_ffmpeg_error_message(e)) from e
+
+DEFAULT_OUTPUT_PROFILE = "reel"
+OUTPUT_PROFILES = {
+    # the original single output: letterboxed 1080x1920 at the configured CRF
+    "reel": {'width': REEL_WIDTH, 'height': REEL_HEIGHT, 'fit': 'pad', 'vcodec': 'libx264', 'ladder': [{'name': 'crf'}]},
+    "9x16": {'width': 1080, 'height': 1920, 'fit': 'pad', 'vcodec': 'libx264', 'ladder': [
+        {'name': '1080p', 'video_bitrate': '6M'},
+        {'name': '720p', 'width': 720, 'height': 1280, 'video_bitrate': '3M'},
+    ]},
+    "1x1": {'width': 1080, 'height': 1080, 'fit': 'crop', 'vcodec': 'libx264', 'ladder': [
+        {'name': '1080p', 'video_bitrate': '5M'},
+        {'name': '720p', 'width': 720, 'height': 720, 'video_bitrate': '2500k'},
+    ]},
+    "16x9": {'width': 1920, 'height': 1080, 'fit': 'pad', 'vcodec': 'libx264', 'ladder': [
+        {'name': '1080p', 'video_bitrate': '6M'},
+        {'name': '720p', 'width': 1280, 'height': 720, 'video_bitrate': '3M'},
+    ]},
+}
+PROFILES_FILE = os.getenv("REELIFY_PROFILES_FILE")
+if PROFILES_FILE and os.path.exists(PROFILES_FILE):
+    with open(PROFILES_FILE, encoding='utf-8') as _profiles:
+        OUTPUT_PROFILES.update(json.load(_profiles))
+SELECTED_OUTPUT_PROFILES = [name.strip() for name in
+                            os.getenv("REELIFY_OUTPUT_PROFILES", DEFAULT_OUTPUT_PROFILE).split(',') if name.strip()]
+_unknown_profiles = [name for name in SELECTED_OUTPUT_PROFILES if name not in OUTPUT_PROFILES]
+if _unknown_profiles:
+    # fail at startup rather than on the first render, after the job has already transcribed
+    raise ValueError(f"Unknown output profile(s) in REELIFY_OUTPUT_PROFILES: {', '.join(_unknown_profiles)} "
+                     f"(known: {', '.join(OUTPUT_PROFILES)})")
+
+def profile_renditions(names=None):
+    """Flatten the named profiles into one rendition (resolution, fit, codec, bitrate) per ladder rung"""
+    renditions = []
+    for name in names or SELECTED_OUTPUT_PROFILES:
+        if name not in OUTPUT_PROFILES:
+            raise ValueError(f"Unknown output profile: {name}")
+        profile = OUTPUT_PROFILES[name]
+        for rung in profile.get('ladder') or [{'name': 'crf'}]:
+            renditions.append({
+                'key': name if len(profile.get('ladder') or []) <= 1 else f"{name}_{rung['name']}",
+                'profile': name,
+                'width': rung.get('width', profile['width']),
+                'height': rung.get('height', profile['height']),
+                'fit': rung.get('fit', profile.get('fit', 'pad')),
+                'vcodec': rung.get('vcodec', profile.get('vcodec', 'libx264')),
+                'acodec': rung.get('acodec', profile.get('acodec', 'aac')),
+                'audio_bitrate': rung.get('audio_bitrate', profile.get('audio_bitrate')),
+                'video_bitrate': rung.get('video_bitrate'),
+            })
+    return renditions
+
+def is_default_output(renditions):
+    """True for the single letterboxed 1080x1920 CRF reel that every render backend can produce"""
+    if len(renditions) != 1:
+        return False
+    rendition = renditions[0]
+    return ((rendition['width'], rendition['height']) == (REEL_WIDTH, REEL_HEIGHT) and rendition['fit'] == 'pad'
+            and (rendition['vcodec'], rendition['acodec']) == ('libx264', 'aac')
+            and not rendition['video_bitrate'] and not rendition['audio_bitrate'])
+
+def rendition_path(output_path, rendition):
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{rendition['key']}{ext or '.mp4'}"
+
+def detect_face_center(input_video_path, start_time, end_time, samples=5, width=320):
+    """Normalized (x, y) of the median detected face over a few frames, or None without OpenCV or faces"""
+    try:
+        import cv2
+    except ImportError:
+        return None
+    info = probe_media(input_video_path)
+    if not info['width'] or not info['height']:
+        return None
+    height = int(round(info['height'] * width / info['width'] / 2)) * 2
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    centers = []
+    for n in range(samples):
+        at = start_time + (end_time - start_time) * (n + 0.5) / samples
+        try:
+            frame, _ = run_ffmpeg_measured(
+                ffmpeg.input(input_video_path, ss=at)
+                .output('pipe:', vframes=1, format='rawvideo', pix_fmt='gray', s=f"{width}x{height}")
+            )
+        except ffmpeg.Error:
+            continue
+        if len(frame) < width * height:
+            continue
+        image = np.frombuffer(frame[:width * height], dtype=np.uint8).reshape(height, width)
+        faces = cascade.detectMultiScale(image, scaleFactor=1.1, minNeighbors=5)
+        if len(faces):
+            x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+            centers.append(((x + w / 2) / width, (y + h / 2) / height))
+    if not centers:
+        return None
+    return float(np.median([c[0] for c in centers])), float(np.median([c[1] for c in centers]))
+
+def _fit_to_rendition(video, rendition, focus=None):
+    """Pad the frame into the rendition (letterbox) or crop it to fill, centred on focus when given"""
+    width, height = rendition['width'], rendition['height']
+    if rendition['fit'] == 'pad':
+        return _fit_to_reel(video, width, height)
+    fx, fy = focus or (0.5, 0.5)
+    return (
+        video
+        .filter('scale', width, height, force_original_aspect_ratio='increase')
+        .filter('crop', width, height, f"min(max(iw*{fx:.4f}-ow/2,0),iw-ow)", f"min(max(ih*{fy:.4f}-oh/2,0),ih-oh)")
+        .filter('setsar', 1)
+    )
+
+def _parse_bitrate(value):
+    """Bits per second from an ffmpeg-style bitrate such as '6M', '2500k' or 800000"""
+    value = str(value).strip()
+    scale = {'k': 1000, 'm': 1000000}.get(value[-1:].lower(), 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+def _rendition_encode_options(rendition, preset=None, crf=None, threads=None):
+    options = _reel_encode_options(preset, crf, threads)
+    options['vcodec'] = rendition['vcodec']
+    options['acodec'] = rendition['acodec']
+    if rendition['vcodec'] in ('libx265', 'hevc'):
+        options['tag:v'] = 'hvc1'
+    if rendition['video_bitrate']:
+        options.pop('crf')
+        options['video_bitrate'] = rendition['video_bitrate']
+        options['maxrate'] = rendition['video_bitrate']
+        # a two-second VBV buffer keeps the rate capped without starving scene changes
+        options['bufsize'] = str(2 * _parse_bitrate(rendition['video_bitrate']))
+    if rendition['audio_bitrate']:
+        options['audio_bitrate'] = rendition['audio_bitrate']
+    return options
+
+def render_reel_renditions(input_video_path, start_time, end_time, output_path, renditions, max_duration=30,
+                           video_duration=None, preset=None, crf=None, threads=None):
+    """Decode the segment once and encode every rendition from it; the first rendition is the reel's main file"""
+    result = {'path': None, 'start': start_time, 'end': end_time, 'backend': 'ffmpeg-profiles',
+              'render_path': "encode", 'success': False, 'error': None, 'render_seconds': 0.0, 'metrics': {},
+              'renditions': {}}
+    started = time.perf_counter()
+    try:
+        with measure_stage(result['metrics']):
+            start_time, end_time = clamp_reel_segment(start_time, end_time, max_duration, video_duration)
+            result['start'], result['end'] = start_time, end_time
+            focus = None
+            if any(r['fit'] == 'face' for r in renditions):
+                focus = detect_face_center(input_video_path, start_time, end_time)
+            source = ffmpeg.input(input_video_path, ss=start_time, t=end_time - start_time)
+            video_branches = source.video.filter_multi_output('split', len(renditions))
+            has_audio = _probe_source_streams(input_video_path)['has_audio']
+            audio_branches = source.audio.filter_multi_output('asplit', len(renditions)) if has_audio else None
+            outputs = []
+            for n, rendition in enumerate(renditions):
+                path = rendition_path(output_path, rendition)
+                streams = [_fit_to_rendition(video_branches[n], rendition, focus)]
+                if audio_branches is not None:
+                    streams.append(audio_branches[n])
+                outputs.append(ffmpeg.output(*streams, path, **_rendition_encode_options(rendition, preset, crf, threads)))
+                result['renditions'][rendition['key']] = path
+            _run_ffmpeg(ffmpeg.merge_outputs(*outputs))
+            result['path'] = result['renditions'][renditions[0]['key']]
+            result['success'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    result['render_seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+def stream_copy_compatible(input_video_path):
+    """True when the source is already 1080x1920 yuv420p H.264 with AAC (or no) audio, so reels can skip the re-encode"""
+    try:
+        info = probe_media(input_video_path)
+    except Exception:
+        return False
+    if info['video_codec'] != 'h264' or info['pix_fmt'] != 'yuv420p':
+        return False
+    if (info['width'], info['height']) != (REEL_WIDTH, REEL_HEIGHT):
+        return False
+    if info['sample_aspect_ratio'] not in ('1:1', '0:1', 'N/A'):
+        return False
+    return all(codec == 'aac' for codec in info['audio_codecs'])
+
+def _run_ffmpeg(stream):
+    try:
+        run_ffmpeg_measured(stream.overwrite_output())
+    except ffmpeg.Error as e:
+        raise RuntimeError(_ffmpeg_error_message(e)) from e
+
+def _render_reel_stream_copy(input_video_path, start_time, end_time, output_path, preset=None, crf=None, threads=None):
+    """Cut without a full re-encode; returns the path taken ('copy' or 'smartcut') or None if not applicable"""
+    # one packet scan per source, cached by probe_media and shared by every reel cut from it
+    keyframes = probe_media(input_video_path, keyframes=True)['keyframes']
+    previous = [k for k in keyframes if k <= start_time]
+    if previous and start_time - previous[-1] <= STREAM_COPY_TOLERANCE:
+        cut = previous[-1]
+        _run_ffmpeg(ffmpeg.input(input_video_path, ss=cut, t=end_time - cut)
+                    .output(output_path, c='copy', movflags='+faststart', avoid_negative_ts='make_zero'))
+        return "copy"
+    following = [k for k in keyframes if start_time < k < end_time - 1]
+    if not following:
+        return None
+    # Smart cut: re-encode only up to the first keyframe inside the segment and copy the rest.
+    # MPEG-TS parts carry their own SPS/PPS, so the differently encoded head concatenates cleanly.
+    split = following[0]
+    workdir = os.path.dirname(os.path.abspath(output_path))
+    head_path = os.path.join(workdir, f"smartcut-head-{uuid.uuid4().hex}.ts")
+    body_path = os.path.join(workdir, f"smartcut-body-{uuid.uuid4().hex}.ts")
+    try:
+        head_options = _reel_encode_options(preset, crf, threads)
+        head_options.pop('movflags')
+        head = ffmpeg.input(input_video_path, ss=start_time, t=split - start_time)
+        _run_ffmpeg(ffmpeg.output(head.video, head['a?'], head_path, format='mpegts', **head_options))
+        _run_ffmpeg(ffmpeg.input(input_video_path, ss=split, t=end_time - split)
+                    .output(body_path, c='copy', format='mpegts', **{'bsf:v': 'h264_mp4toannexb'}))
+        _run_ffmpeg(ffmpeg.input(f"concat:{head_path}|{body_path}")
+                    .output(output_path, c='copy', movflags='+faststart', **{'bsf:a': 'aac_adtstoasc'}))
+    finally:
+        for part in (head_path, body_path):
+            if os.path.exists(part):
+                os.remove(part)
+    return "smartcut"
+
+def render_reel(input_video_path, start_time, end_time, output_path, max_duration=30, video_duration=None,
+                backend=None, preset=None, crf=None, threads=None, temp_audio_path=None):
+    """Render one reel with the selected backend and return a result dict"""
+    backend = backend or REEL_RENDER_BACKEND
+    result = {'path': output_path, 'start': start_time, 'end': end_time, 'backend': backend,
+              'render_path': None, 'success': False, 'error': None, 'render_seconds': 0.0, 'metrics': {}}
+    started = time.perf_counter()
+    try:
+        with measure_stage(result['metrics']):
+            start_time, end_time = clamp_reel_segment(start_time, end_time, max_duration, video_duration)
+            result['start'], result['end'] = start_time, end_time
+            render_path = None
+            if REEL_STREAM_COPY and stream_copy_compatible(input_video_path):
+                try:
+                    render_path = _render_reel_stream_copy(input_video_path, start_time, end_time, output_path,
+                                                           preset, crf, threads)
+                except Exception:
+                    render_path = None
+            if not render_path:
+                if backend == "ffmpeg":
+                    _render_reel_ffmpeg(input_video_path, start_time, end_time, output_path, preset, crf, threads)
+                elif backend == "moviepy":
+                    _render_reel_moviepy(input_video_path, start_time, end_time, output_path, threads, temp_audio_path)
+                else:
+                    raise ValueError(f"Unknown render backend: {backend}")
+                render_path = "encode"
+            result['render_path'] = render_path
+            result['success'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    result['render_seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+def _probe_source_streams(input_video_path):
+    """Audio presence and video frame rate of the source, with permissive defaults if probing fails"""
+    try:
+        info = probe_media(input_video_path)
+    except Exception:
+        return {'has_audio': True, 'frame_rate': None}
+    return {'has_audio': info['has_audio'], 'frame_rate': info['frame_rate_str']}
+
+def group_nearby_segments(results, max_gap=None):
+    """Split reels (sorted by start) into runs whose gaps are small enough that decoding through them is cheap"""
+    max_gap = REEL_BATCH_MAX_GAP if max_gap is None else max_gap
+    groups = []
+    for r in sorted(results, key=lambda r: r['start']):
+        if groups and r['start'] - max(g['end'] for g in groups[-1]) <= max_gap:
+            groups[-1].append(r)
+        else:
+            groups.append([r])
+    return groups
+
+def render_reels_batch(input_video_path, segments, output_paths, max_duration=30, video_duration=None,
+                       preset=None, crf=None):
+    """Render nearby segments from one shared decode per group, and seek separately to isolated ones"""
+    results = []
+    for (start_time, end_time), output_path in zip(segments, output_paths):
+        result = {'path': output_path, 'start': start_time, 'end': end_time, 'backend': 'ffmpeg-batch',
+                  'render_path': "encode", 'success': False, 'error': None, 'render_seconds': 0.0}
+        try:
+            result['start'], result['end'] = clamp_reel_segment(start_time, end_time, max_duration, video_duration)
+        except ValueError as e:
+            result['error'] = str(e)
+        results.append(result)
+    pending = [r for r in results if r['error'] is None]
+    if not pending:
+        return results
+    source_info = _probe_source_streams(input_video_path)
+    for group in group_nearby_segments(pending):
+        if len(group) == 1:
+            r = group[0]
+            single = render_reel(input_video_path, r['start'], r['end'], r['path'], max_duration=max_duration,
+                                 video_duration=video_duration, backend="ffmpeg", preset=preset, crf=crf)
+            r.update(success=single['success'], error=single['error'], render_seconds=single['render_seconds'],
+                     render_path=single['render_path'], metrics=single['metrics'])
+        else:
+            group_metrics = {}
+            with measure_stage(group_metrics):
+                _render_segment_group(input_video_path, group, source_info, max_duration, video_duration, preset, crf)
+            for r in group:
+                r['metrics'] = _share_metrics(group_metrics, len(group))
+    return results
+
+def _share_metrics(metrics, count):
+    """One reel's even share of a measurement taken over a whole group render"""
+    share = dict(metrics, group_size=count)
+    for key in ('wall_seconds', 'cpu_seconds', 'child_cpu_seconds'):
+        share[key] = round(metrics[key] / count, 3)
+    for key in ('read_bytes', 'write_bytes'):
+        if metrics[key] is not None:
+            share[key] = metrics[key] // count
+    return share
+
+def _render_segment_group(input_video_path, pending, source_info, max_duration, video_duration, preset, crf):
+    """Decode the span covering the group once, split it and encode each reel from its trimmed branch"""
+    started = time.perf_counter()
+    window_start = min(r['start'] for r in pending)
+    window_end = max(r['end'] for r in pending)
+    source = ffmpeg.input(input_video_path, ss=window_start, t=window_end - window_start)
+    video_branches = source.video.filter_multi_output('split', len(pending))
+    audio_branches = source.audio.filter_multi_output('asplit', len(pending)) if source_info['has_audio'] else None
+    outputs = []
+    for n, r in enumerate(pending):
+        offset_start, offset_end = r['start'] - window_start, r['end'] - window_start
+        video = video_branches[n].trim(start=offset_start, end=offset_end).setpts('PTS-STARTPTS')
+        if source_info['frame_rate']:
+            # trim drops the stream's frame rate, which would make the muxer fall back to 25 fps
+            video = video.filter('fps', source_info['frame_rate'])
+        streams = [_fit_to_reel(video)]
+        if audio_branches is not None:
+            streams.append(audio_branches[n].filter('atrim', start=offset_start, end=offset_end).filter('asetpts', 'PTS-STARTPTS'))
+        outputs.append(ffmpeg.output(*streams, r['path'], **_reel_encode_options(preset, crf)))
+    try:
+        run_ffmpeg_measured(ffmpeg.merge_outputs(*outputs).overwrite_output())
+        elapsed = round(time.perf_counter() - started, 3)
+        for r in pending:
+            if os.path.exists(r['path']) and os.path.getsize(r['path']) > 0:
+                r['success'] = True
+            else:
+                r['error'] = "Reel was not written"
+            r['render_seconds'] = elapsed
+    except ffmpeg.Error:
+        # One bad segment fails the whole graph; render the reels individually so the rest still succeed
+        for r in pending:
+            single = render_reel(input_video_path, r['start'], r['end'], r['path'], max_duration=max_duration,
+                                 video_duration=video_duration, backend="ffmpeg", preset=preset, crf=crf)
+            r.update(success=single['success'], error=single['error'], render_seconds=single['render_seconds'],
+                     render_path=single['render_path'])
+
+def render_reels_parallel(input_video_path, segments, output_paths, max_duration=30, video_duration=None,
+                          backend=None, workers=None, threads=None, on_progress=None):
+    """Render reels on a bounded process pool, reporting each as it finishes and returning them in segment order"""
+    workers = max(1, min(workers or REEL_RENDER_WORKERS, len(segments)))
+    threads = threads or encoder_threads_per_job(workers)
+    jobs = [
+        {'input_video_path': input_video_path, 'start_time': start_time, 'end_time': end_time,
+         'output_path': output_path, 'max_duration': max_duration, 'video_duration': video_duration,
+         'backend': backend, 'threads': threads, 'temp_audio_path': temp_audio_path_for(output_path)}
+        for (start_time, end_time), output_path in zip(segments, output_paths)
+    ]
+    results = [None] * len(jobs)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=PROCESS_POOL_CONTEXT) as pool:
+            futures = {pool.submit(worker_jobs.render_reel_job, job): i for i, job in enumerate(jobs)}
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    results[i] = {'path': jobs[i]['output_path'], 'start': jobs[i]['start_time'],
+                                  'end': jobs[i]['end_time'], 'backend': backend, 'render_path': None, 'success': False,
+                                  'error': f"Render worker failed: {e}", 'render_seconds': 0.0}
+                charge_stage_metrics(results[i].get('metrics') or {}, worker_process=True)
+                if on_progress:
+                    on_progress(done, len(jobs), results[i])
+    finally:
+        for job in jobs:
+            if os.path.exists(job['temp_audio_path']):
+                try:
+                    os.remove(job['temp_audio_path'])
+                except OSError:
+                    pass
+    return results
+
+def render_reels(input_video_path, segments, output_paths, max_duration=30, video_duration=None,
+                 backend=None, on_progress=None, renditions=None):
+    """Render a list of segments as one batched ffmpeg job, on the process pool, or one after another.
+
+    With renditions other than the default reel, every segment is decoded once and encoded to each rendition.
+    """
+    if renditions and not is_default_output(renditions):
+        workers = max(1, min(REEL_RENDER_WORKERS, len(segments)))
+        # each segment runs one encoder per rendition side by side
+        threads = encoder_threads_per_job(workers, len(renditions))
+        results = [None] * len(segments)
+        # the work happens in ffmpeg subprocesses, so threads are enough to run segments side by side
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(render_reel_renditions, input_video_path, start_time, end_time, output_path,
+                                   renditions, max_duration, video_duration, threads=threads): i
+                       for i, ((start_time, end_time), output_path) in enumerate(zip(segments, output_paths))}
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                charge_stage_metrics(results[futures[future]]['metrics'])
+                if on_progress:
+                    on_progress(done, len(segments), results[futures[future]])
+        return results
+    backend = backend or REEL_RENDER_BACKEND
+    fast_path = REEL_STREAM_COPY and stream_copy_compatible(input_video_path)
+    if backend == "ffmpeg" and REEL_BATCH_RENDER and len(segments) > 1 and not fast_path:
+        results = render_reels_batch(input_video_path, segments, output_paths, max_duration, video_duration)
+        if on_progress:
+            for done, result in enumerate(results, 1):
+                on_progress(done, len(results), result)
+        return results
+    if REEL_RENDER_WORKERS > 1 and len(segments) > 1:
+        return render_reels_parallel(input_video_path, segments, output_paths, max_duration, video_duration,
+                                     backend=backend, on_progress=on_progress)
+    results = []
+    for (start_time, end_time), output_path in zip(segments, output_paths):
+        result = render_reel(input_video_path, start_time, end_time, output_path, max_duration=max_duration,
+                             video_duration=video_duration, backend=backend)
+        results.append(result)
+        if on_progress:
+            on_progress(len(results), len(segments), result)
+    return results
+
+def create_reel(input_video_path, start_time, end_time, output_path, max_duration=30, video_duration=None, backend=None,
+                on_error=None):
+    """Render one reel and return whether it succeeded; the error message goes to on_error"""
+    result = render_reel(input_video_path, start_time, end_time, output_path,
+                         max_duration=max_duration, video_duration=video_duration, backend=backend)
+    if not result['success'] and on_error:
+        on_error(f"❌ Error creating reel: {result['error']}")
+    return result['success']
+
+def evaluate_reel_quality(reel_path, expected_start, expected_end, transcript_segment="", expected_frame_rate=None,
+                          expected_resolution=None):
+    """Check a rendered reel from its probe data; blackdetect only runs when the bitrate suggests mostly black video"""
+    expected_resolution = tuple(expected_resolution or (REEL_WIDTH, REEL_HEIGHT))
+    quality_report = {'duration_check': False, 'resolution_check': False, 'av_sync_check': False,
+                      'frame_rate_check': False, 'black_frame_ratio': None,
                       'file_exists': False, 'file_size_mb': 0, 'issues': []}
-    clip = None
     try:
         if not os.path.exists(reel_path):
             quality_report['issues'].append("Reel file does not exist")
@@ -356,184 +1808,1482 @@ def evaluate_reel_quality(reel_path, expected_start, expected_end, transcript_se
         quality_report['file_size_mb'] = round(size, 2)
         if size < 0.1:
             quality_report['issues'].append("File size too small")
-        clip = VideoFileClip(reel_path)
-        actual_duration = clip.duration
+        info = probe_media(reel_path)
+        actual_duration = info['duration']
         expected_duration = expected_end - expected_start
         if abs(actual_duration - expected_duration) <= 2:
             quality_report['duration_check'] = True
         else:
             quality_report['issues'].append(f"Duration mismatch: got {actual_duration:.1f}s")
-        if clip.size == (1080, 1920):
+        if (info['width'], info['height']) == expected_resolution:
             quality_report['resolution_check'] = True
         else:
-            quality_report['issues'].append(f"Wrong resolution: {clip.size}")
+            quality_report['issues'].append(f"Wrong resolution: {info['width']}x{info['height']}")
         if actual_duration < 5:
             quality_report['issues'].append("Reel too short (< 5s)")
         elif actual_duration > 60:
             quality_report['issues'].append("Reel too long (> 60s)")
+
+        if not info['has_audio']:
+            quality_report['av_sync_check'] = True
+        else:
+            offsets = [abs(a - b) for a, b in ((info['video_start'], info['audio_start']),
+                                               (info['video_duration'], info['audio_duration']))
+                       if a is not None and b is not None]
+            drift = max(offsets, default=0.0)
+            if drift <= AV_SYNC_TOLERANCE:
+                quality_report['av_sync_check'] = True
+            else:
+                quality_report['issues'].append(f"Audio/video out of sync by {drift:.2f}s")
+
+        frame_rate = info['frame_rate']
+        if frame_rate and (abs(frame_rate - expected_frame_rate) <= max(0.5, expected_frame_rate * 0.01)
+                           if expected_frame_rate else 0 < frame_rate <= 240):
+            quality_report['frame_rate_check'] = True
+        else:
+            quality_report['issues'].append(f"Unexpected frame rate: {frame_rate or 'unknown'} fps")
+
+        bit_rate = info['video_bit_rate'] or info['bit_rate']
+        if bit_rate and frame_rate and info['width'] and info['height']:
+            bits_per_pixel = bit_rate / (info['width'] * info['height'] * frame_rate)
+            if bits_per_pixel < BLACK_FRAME_SUSPECT_BPP:
+                ratio = black_frame_ratio(reel_path)
+                quality_report['black_frame_ratio'] = round(ratio, 3) if ratio is not None else None
+                if ratio is not None and ratio > BLACK_FRAME_MAX_RATIO:
+                    quality_report['issues'].append(f"{ratio:.0%} of the reel is black")
     except Exception as e:
         quality_report['issues'].append(f"Error analyzing reel: {str(e)}")
-    finally:
-        try:
-            if clip:
-                clip.close()
-        except:
-            pass
-        gc.collect()
     return quality_report
 
-def create_download_zip(reel_paths, tmpdir):
+def create_download_zip(reel_paths, tmpdir, names=None):
     zip_path = os.path.join(tmpdir, "video_reels.zip")
-    with zipfile.ZipFile(zip_path, 'w') as zip_file:
-        for i, reel_path in enumerate(reel_paths, 1):
+    names = names or [f"reel_{i}.mp4" for i in range(1, len(reel_paths) + 1)]
+    # MP4s are already compressed; ZIP_STORED copies each reel in chunks without deflating it
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as zip_file:
+        for reel_path, name in zip(reel_paths, names):
             if os.path.exists(reel_path):
-                zip_file.write(reel_path, f"reel_{i}.mp4")
+                zip_file.write(reel_path, name)
     return zip_path
 
-def main_app():
-    """Main application after authentication"""
-    st.title("🎬 Smart Video Processor with Reel Creation")
-    
+IO_CHUNK_BYTES = int(os.getenv("REELIFY_IO_CHUNK_BYTES", str(1024 * 1024)))
 
-    show_user_profile()
-    
+def copy_upload_to_disk(uploaded_file, target_path, chunk_size=None):
+    """Copy an upload to disk in fixed-size blocks, returning the SHA-256 of its content"""
+    chunk_size = chunk_size or IO_CHUNK_BYTES
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    with open(target_path, 'wb') as f:
+        for chunk in iter(lambda: uploaded_file.read(chunk_size), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
 
-    if st.session_state.get('show_history', False):
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where it can't be measured"""
+    try:
+        import resource
+        return _maxrss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+def current_rss_mb():
+    """Resident memory of this process right now in MB; unlike peak_rss_mb it also falls"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+@contextmanager
+def track_memory(metrics, interval=0.25):
+    """Sample current RSS in the background while the block runs, keeping its start, peak and growth in metrics"""
+    start = current_rss_mb()
+    metrics.update(rss_start_mb=start, rss_peak_mb=start, rss_growth_mb=0.0)
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            rss = current_rss_mb()
+            if rss is not None and rss > (metrics['rss_peak_mb'] or 0):
+                metrics['rss_peak_mb'] = rss
+                metrics['rss_growth_mb'] = round(rss - (start or 0), 1)
+
+    sampler = threading.Thread(target=sample, daemon=True, name="reelify-rss-sampler")
+    sampler.start()
+    try:
+        yield metrics
+    finally:
+        done.set()
+        sampler.join()
+
+def _io_bytes():
+    """Bytes the calling thread has passed through read and write calls, or (None, None) where unavailable"""
+    try:
+        with open('/proc/thread-self/io') as f:
+            counters = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import psutil
+        counters = psutil.Process().io_counters()
+        return (getattr(counters, 'read_chars', counters.read_bytes),
+                getattr(counters, 'write_chars', counters.write_bytes))
+    except Exception:
+        return None, None
+
+def _maxrss_mb(maxrss):
+    return round(maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def _process_io_bytes(pid):
+    """Bytes a (finished but unreaped) process passed through read and write calls, or (0, 0) where unavailable"""
+    try:
+        with open(f'/proc/{pid}/io') as f:
+            counters = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+_stage_usage = threading.local()
+
+def _charge_child_usage(cpu_seconds=0.0, peak_rss_mb=None, read_bytes=0, write_bytes=0):
+    """Add a child's usage to every measure_stage block open on the calling thread"""
+    for usage in getattr(_stage_usage, 'open', ()):
+        usage['cpu_seconds'] += cpu_seconds or 0.0
+        if peak_rss_mb is not None:
+            usage['peak_rss_mb'] = max(usage['peak_rss_mb'] or 0.0, peak_rss_mb)
+        usage['read_bytes'] += read_bytes or 0
+        usage['write_bytes'] += write_bytes or 0
+
+def charge_stage_metrics(metrics, worker_process=False):
+    """Charge a measurement taken on a worker thread or process to the measure_stage blocks open on this thread"""
+    peaks = [metrics.get('child_peak_rss_mb')] + ([metrics.get('peak_rss_mb')] if worker_process else [])
+    peaks = [peak for peak in peaks if peak is not None]
+    _charge_child_usage((metrics.get('cpu_seconds') or 0.0) + (metrics.get('child_cpu_seconds') or 0.0),
+                        max(peaks) if peaks else None, metrics.get('read_bytes'), metrics.get('write_bytes'))
+
+def run_ffmpeg_measured(stream):
+    """stream.run(capture_stdout=True, capture_stderr=True) that charges ffmpeg's CPU, peak RSS and I/O to this
+    thread's open measure_stage blocks, so concurrent jobs don't see each other's subprocesses"""
+    process = stream.run_async(pipe_stdout=True, pipe_stderr=True)
+    if not (hasattr(os, 'waitid') and hasattr(os, 'wait4')):
+        out, err = process.communicate()
+    else:
+        captured = {}
+        reader = threading.Thread(target=lambda: captured.update(out=process.stdout.read()), daemon=True)
+        reader.start()
+        err = process.stderr.read()
+        reader.join()
+        out = captured.get('out', b'')
+        process.stdout.close()
+        process.stderr.close()
+        # wait without reaping so /proc/<pid>/io is still readable, then reap with wait4 for the rusage
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        read_bytes, write_bytes = _process_io_bytes(process.pid)
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        _charge_child_usage(rusage.ru_utime + rusage.ru_stime, _maxrss_mb(rusage.ru_maxrss), read_bytes, write_bytes)
+    if process.returncode:
+        raise ffmpeg.Error('ffmpeg', out, err)
+    return out, err
+
+@contextmanager
+def measure_stage(metrics):
+    """Fill metrics with the enclosed block's wall time, CPU time, peak RSS and I/O bytes.
+
+    CPU and I/O are those of the calling thread plus the ffmpeg runs and worker measurements charged to it;
+    child CPU and child peak RSS cover only those, and peak RSS is the process high-water mark when the block ends.
+    """
+    usage = {'cpu_seconds': 0.0, 'peak_rss_mb': None, 'read_bytes': 0, 'write_bytes': 0}
+    open_usage = _stage_usage.__dict__.setdefault('open', [])
+    open_usage.append(usage)
+    thread_cpu = time.thread_time()
+    read_bytes, write_bytes = _io_bytes()
+    started = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        open_usage.pop()
+        read_after, write_after = _io_bytes()
+        metrics.update({
+            'wall_seconds': round(time.perf_counter() - started, 3),
+            'cpu_seconds': round(time.thread_time() - thread_cpu, 3),
+            'child_cpu_seconds': round(usage['cpu_seconds'], 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'child_peak_rss_mb': usage['peak_rss_mb'],
+            'read_bytes': (read_after - read_bytes + usage['read_bytes']
+                           if read_bytes is not None and read_after is not None else None),
+            'write_bytes': (write_after - write_bytes + usage['write_bytes']
+                            if write_bytes is not None and write_after is not None else None),
+        })
+
+@contextmanager
+def trace_span(trace, stage, item=None):
+    """Measure the enclosed block and append it to trace as a {'stage', 'item', ...metrics} record"""
+    span = {'stage': stage, 'item': item}
+    try:
+        with measure_stage(span):
+            yield span
+    finally:
+        trace.append(span)
+
+RESULT_CACHE_DIR = os.getenv("REELIFY_CACHE_DIR", ".reelify_cache")
+RESULT_CACHE_MAX_MB = float(os.getenv("REELIFY_CACHE_MAX_MB", "5120"))
+_CACHE_MARKER = ".complete"
+
+@st.cache_resource
+def _result_cache_state():
+    """Shared lock and per-stage hit/miss counters for the on-disk result cache"""
+    return {'lock': threading.Lock(), 'stats': {}, 'evictions': 0}
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in fixed-size chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _cache_entry_dir(content_key, stage, params):
+    params_hash = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(RESULT_CACHE_DIR, content_key, f"{stage}-{params_hash}")
+
+def _count_cache(stage, outcome):
+    state = _result_cache_state()
+    with state['lock']:
+        counters = state['stats'].setdefault(stage, {'hits': 0, 'misses': 0})
+        counters[outcome] += 1
+
+def cache_get(content_key, stage, params):
+    """Return the entry directory for a cached stage output, or None on a miss"""
+    entry = _cache_entry_dir(content_key, stage, params)
+    marker = os.path.join(entry, _CACHE_MARKER)
+    if content_key and os.path.exists(marker):
+        try:
+            os.utime(marker)
+        except OSError:
+            pass
+        _count_cache(stage, 'hits')
+        return entry
+    _count_cache(stage, 'misses')
+    return None
+
+def cache_load_json(entry, name="data.json"):
+    with open(os.path.join(entry, name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def cache_put(content_key, stage, params, files=None, data=None):
+    """Store stage outputs (files are moved into the cache) and return the entry directory"""
+    entry = _cache_entry_dir(content_key, stage, params)
+    staging = f"{entry}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(staging, exist_ok=True)
+    try:
+        for name, path in (files or {}).items():
+            shutil.move(path, os.path.join(staging, name))
+        if data is not None:
+            with open(os.path.join(staging, "data.json"), 'w', encoding='utf-8') as f:
+                json.dump(data, f, default=float)
+        open(os.path.join(staging, _CACHE_MARKER), 'w').close()
+        if os.path.exists(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        os.replace(staging, entry)
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+    evict_result_cache(keep=entry)
+    return entry
+
+def _file_inodes(*paths):
+    """{(st_dev, st_ino): [bytes, links found under paths, st_nlink]} for the files at or under paths"""
+    inodes = {}
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = (os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        for file_path in files:
+            try:
+                info = os.lstat(file_path)
+            except OSError:
+                continue
+            key = (info.st_dev, info.st_ino)
+            if key in inodes:
+                inodes[key][1] += 1
+            else:
+                inodes[key] = [info.st_size, 1, info.st_nlink]
+    return inodes
+
+def _dir_size(*paths):
+    """Bytes on disk for the files under paths; job directories hard-link cached and stored media, so each
+    linked file counts once"""
+    return sum(size for size, _, _ in _file_inodes(*paths).values())
+
+def _reclaimable_bytes(path):
+    """Bytes that deleting path would free: files with no hard links outside it"""
+    return sum(size for size, links, nlink in _file_inodes(path).values() if links >= nlink)
+
+def _result_cache_entries():
+    """(last used, path, bytes) for every complete result cache entry and cached LLM response"""
+    entries = []
+    if os.path.isdir(LLM_CACHE_DIR):
+        for name in os.listdir(LLM_CACHE_DIR):
+            path = os.path.join(LLM_CACHE_DIR, name)
+            if name.endswith('.json'):
+                try:
+                    entries.append((os.path.getmtime(path), path, os.path.getsize(path)))
+                except OSError:
+                    pass
+    if os.path.isdir(RESULT_CACHE_DIR):
+        for content_key in os.listdir(RESULT_CACHE_DIR):
+            content_dir = os.path.join(RESULT_CACHE_DIR, content_key)
+            if not os.path.isdir(content_dir):
+                continue
+            for name in os.listdir(content_dir):
+                entry = os.path.join(content_dir, name)
+                marker = os.path.join(entry, _CACHE_MARKER)
+                if os.path.exists(marker):
+                    entries.append((os.path.getmtime(marker), entry, _dir_size(entry)))
+    return entries
+
+def _remove_result_cache_entry(state, entry):
+    """Delete one cache entry or LLM response; the caller holds the cache lock"""
+    state['evictions'] += 1
+    if os.path.isfile(entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
         return
-    
-    uploaded_file = st.file_uploader("📤 Upload a video", type=["mp4", "mov", "avi"])
-    video_url = st.text_input("🔗 Or paste a YouTube video URL")
+    shutil.rmtree(entry, ignore_errors=True)
+    content_dir = os.path.dirname(entry)
+    if os.path.isdir(content_dir) and not os.listdir(content_dir):
+        os.rmdir(content_dir)
+
+def evict_result_cache(max_mb=None, keep=None):
+    """Delete least recently used cache entries, LLM responses included, until the cache fits within its size cap"""
+    max_bytes = (RESULT_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    state = _result_cache_state()
+    with state['lock']:
+        entries = _result_cache_entries()
+        total = sum(size for _, _, size in entries)
+        for _, entry, size in sorted(entries):
+            if total <= max_bytes:
+                break
+            if entry == keep:
+                continue
+            total -= size
+            _remove_result_cache_entry(state, entry)
 
-    tmpdir = tempfile.mkdtemp()
-    video_path = None
-    video_name = None
+def result_cache_stats():
+    """Snapshot of per-stage hit/miss counters and the eviction count"""
+    state = _result_cache_state()
+    with state['lock']:
+        return {
+            'stages': {stage: dict(counters) for stage, counters in state['stats'].items()},
+            'evictions': state['evictions'],
+        }
+
+LLM_MODEL = os.getenv("REELIFY_LLM_MODEL", "gpt-3.5-turbo")
+LLM_CHUNK_TOKENS = int(os.getenv("REELIFY_LLM_CHUNK_TOKENS", "3000"))
+LLM_CONCURRENCY = int(os.getenv("REELIFY_LLM_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("REELIFY_LLM_MAX_RETRIES", "4"))
+LLM_CACHE_DIR = os.getenv("REELIFY_LLM_CACHE_DIR", os.path.join(RESULT_CACHE_DIR, "llm"))
+_RETRYABLE_LLM_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                         openai.InternalServerError)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_TOKEN_ENCODINGS = {}
 
-    if video_url and not uploaded_file:
-        with st.spinner("Downloading video from YouTube..."):
+def _token_encoding(model):
+    if model not in _TOKEN_ENCODINGS:
+        encoding = None
+        if tiktoken is not None:
             try:
-                video_path = download_youtube_video(video_url, tmpdir)
-                if video_path and os.path.exists(video_path):
-                    video_name = os.path.basename(video_path)
-                    st.success("✅ Download complete!")
-                    st.video(video_path)
-                else:
-                    st.error("❌ Failed to download video - file not found after download")
-            except Exception as e:
-                st.error(f"❌ YouTube download failed: {e}")
-                st.info("💡 Try using a different YouTube URL or upload the video file directly")
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                try:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    encoding = None
+            except Exception:
+                # tiktoken downloads its BPE files on first use, which fails offline
+                encoding = None
+        _TOKEN_ENCODINGS[model] = encoding
+    return _TOKEN_ENCODINGS[model]
 
-    if uploaded_file:
-        video_path = os.path.join(tmpdir, "input_video.mp4")
-        video_name = uploaded_file.name
-        with open(video_path, "wb") as f:
-            f.write(uploaded_file.read())
-        st.success("✅ File uploaded successfully!")
-        st.video(video_path)
-
-    if video_path and os.path.exists(video_path):
+def count_tokens(text, model=None):
+    """Token count for the model, or a 4-characters-per-token estimate when tiktoken is unavailable"""
+    encoding = _token_encoding(model or LLM_MODEL)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, len(text) // 4)
+
+def chunk_lines_by_tokens(lines, budget=None, model=None):
+    """Group lines into chunks whose token count stays within the budget"""
+    budget = budget or LLM_CHUNK_TOKENS
+    chunks, current, used = [], [], 0
+    for line in lines:
+        tokens = count_tokens(line, model) + 1
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _llm_client():
+    # _complete does its own retries with backoff; the SDK's built-in ones would multiply them
+    return openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=LLM_BASE_URL, max_retries=0)
+
+def _llm_cache_path(model, prompt, max_tokens, temperature):
+    key = hashlib.sha256(json.dumps([model, prompt, max_tokens, temperature]).encode('utf-8')).hexdigest()
+    return os.path.join(LLM_CACHE_DIR, f"{key}.json")
+
+async def _complete(async_client, semaphore, prompt, calls, model=None, max_tokens=500, temperature=0.7):
+    """One chat completion with a persistent response cache, bounded concurrency and retry/backoff"""
+    model = model or LLM_MODEL
+    cache_path = _llm_cache_path(model, prompt, max_tokens, temperature)
+    started = time.perf_counter()
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
         try:
-            st.toast("Extracting audio...")
-            audio_path = os.path.join(tmpdir, "audio.wav")
-            ffmpeg.input(video_path).output(audio_path, **{'q:a': 0, 'map': 'a'}).run(overwrite_output=True, quiet=True)
-            st.audio(audio_path)
-
-            st.toast("Getting video duration...")
-            video_clip = VideoFileClip(video_path)
-            video_duration = video_clip.duration
-            video_clip.close()
-            minutes, seconds = int(video_duration // 60), int(video_duration % 60)
-            duration_str = f"{minutes:02d}:{seconds:02d}"
-            st.info(f"🎥 Video Duration: {duration_str}")
+            os.utime(cache_path)
+        except OSError:
+            pass
+        calls.append({'model': model, 'cached': True, 'attempts': 0, 'prompt_tokens': 0,
+                      'completion_tokens': 0, 'latency_seconds': round(time.perf_counter() - started, 4)})
+        return cached['content']
+    async with semaphore:
+        for attempt in range(1, LLM_MAX_RETRIES + 2):
+            try:
+                response = await async_client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+                break
+            except _RETRYABLE_LLM_ERRORS:
+                if attempt > LLM_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(min(30, 2 ** (attempt - 1)) + random.uniform(0, 0.5))
+    content = response.choices[0].message.content or ""
+    usage = getattr(response, 'usage', None)
+    calls.append({'model': model, 'cached': False, 'attempts': attempt,
+                  'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or count_tokens(prompt, model),
+                  'completion_tokens': getattr(usage, 'completion_tokens', 0) or count_tokens(content, model),
+                  'latency_seconds': round(time.perf_counter() - started, 3)})
+    os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+    staging = f"{cache_path}.tmp-{uuid.uuid4().hex}"
+    with open(staging, 'w', encoding='utf-8') as f:
+        json.dump({'model': model, 'content': content}, f)
+    os.replace(staging, cache_path)
+    evict_result_cache(keep=cache_path)
+    return content
+
+def _highlight_prompt(transcript_lines):
+    return f"""
+    Identify 3-5 most engaging moments for social media reels from this transcript.
 
-            st.toast("Transcribing audio...")
-            model = whisper.load_model("base")
-            result = model.transcribe(audio_path)
-            transcript = result["text"]
-            st.markdown("### 📝 Transcript")
-            st.write(transcript)
+    Each line is one transcript segment formatted as ID|start second|text.
+    Pick runs of consecutive segments lasting 15-30 seconds and answer with one
+    highlight per line in [first ID] - [last ID] format.
 
-            st.toast("Sending to GPT...")
+    Transcript:
+    {chr(10).join(transcript_lines)}
+    """
+
+def _candidate_prompt(transcript_lines):
+    return f"""
+    This is one excerpt of a longer transcript. List up to 3 candidate moments from it
+    that would make engaging social media reels.
+
+    Each line is one transcript segment formatted as ID|start second|text.
+    Pick runs of consecutive segments lasting 15-30 seconds and answer with one
+    candidate per line in [first ID] - [last ID] format.
+
+    Excerpt:
+    {chr(10).join(transcript_lines)}
+    """
+
+def _reduce_prompt(candidates):
+    listing = "\n".join(f"[{first}] - [{last}]: {text}" for first, last, text in candidates)
+    return f"""
+    These candidate moments were picked from different parts of one transcript.
+    Choose the 3-5 most engaging ones for social media reels and answer with one
+    highlight per line, copying its [first ID] - [last ID] range exactly.
+
+    Candidates:
+    {listing}
+    """
+
+async def _select_highlights_async(transcript, model=None, budget=None, indices=None):
+    calls = []
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    async_client = _llm_client()
+    try:
+        lines = format_transcript_for_prompt(transcript, indices).splitlines()
+        chunks = chunk_lines_by_tokens(lines, budget, model)
+        if len(chunks) <= 1:
+            response = await _complete(async_client, semaphore, _highlight_prompt(lines), calls, model)
+            return response, calls
+        partials = await asyncio.gather(*[
+            _complete(async_client, semaphore, _candidate_prompt(chunk), calls, model) for chunk in chunks
+        ])
+        candidates = []
+        for partial in partials:
+            for first, last in segment_id_ranges(partial, len(transcript['texts'])):
+                text = " ".join(transcript['texts'][first:last + 1])[:300]
+                candidates.append((first, last, text))
+        if not candidates:
+            return "", calls
+        response = await _complete(async_client, semaphore, _reduce_prompt(candidates), calls, model)
+        return response, calls
+    finally:
+        await async_client.close()
+
+def select_highlights(transcript, model=None, budget=None, indices=None):
+    """Ask the LLM for highlight segment ranges, map/reducing over token-budgeted transcript chunks.
+
+    indices limits the prompt to those segment IDs. Returns the response text and a list of
+    per-call token and latency records.
+    """
+    return asyncio.run(_select_highlights_async(transcript, model, budget, indices))
+
+def complete_prompt(prompt, model=None, max_tokens=500, temperature=0.7):
+    """Single cached, retried completion; returns the response text and its call records"""
+    async def run():
+        calls = []
+        async_client = _llm_client()
+        try:
+            content = await _complete(async_client, asyncio.Semaphore(1), prompt, calls, model, max_tokens, temperature)
+        finally:
+            await async_client.close()
+        return content, calls
+    return asyncio.run(run())
+
+def summarize_llm_calls(calls):
+    return {
+        'calls': len(calls),
+        'cached': sum(1 for call in calls if call['cached']),
+        'prompt_tokens': sum(call['prompt_tokens'] for call in calls),
+        'completion_tokens': sum(call['completion_tokens'] for call in calls),
+        'latency_seconds': round(sum(call['latency_seconds'] for call in calls), 3),
+    }
+
+def choose_highlights(whisper_result, video_duration, candidates=None, on_warning=None):
+    """Pick reel segments with GPT, falling back to the pre-scored windows when it fails or finds nothing.
+
+    Returns a dict with the (start, end) timestamps, the raw response, the LLM call records and
+    the source of the highlights ('llm' or 'prescore').
+    """
+    candidates = candidates or []
+    transcript = build_transcript(whisper_result)
+    try:
+        if transcript['texts']:
+            indices = None
+            if candidates and video_duration >= PRESCORE_MIN_SECONDS:
+                indices = candidate_segment_indices(transcript, candidates)
+            gpt_response, calls = select_highlights(transcript, indices=indices)
+            timestamps = extract_segments_from_gpt_response(gpt_response, transcript)
+        else:
+            minutes, seconds = int(video_duration // 60), int(video_duration % 60)
             prompt = f"""
     Identify 3-5 most engaging moments for social media reels from this transcript.
 
-    Timestamps should be within {duration_str} ({video_duration:.2f} seconds total).
+    Timestamps should be within {minutes:02d}:{seconds:02d} ({video_duration:.2f} seconds total).
     Use [MM:SS] - [MM:SS] format for each highlight.
 
     Transcript:
-    {transcript}
+    {whisper_result.get("text", "")}
     """
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=500
-            )
-            gpt_response = response.choices[0].message.content
-            st.markdown("### 🎯 Highlighted Segments")
-            st.text(gpt_response)
-
-            timestamps = extract_timestamps_from_gpt_response(gpt_response, video_duration)
-            if timestamps:
-                st.markdown("## 🎞️ Reel Creation")
-                reel_paths = []
-                quality_reports = []
-                progress_bar = st.progress(0)
-                status = st.empty()
-                for i, (start, end) in enumerate(timestamps):
-                    status.text(f"Creating reel {i+1}/{len(timestamps)}...")
-                    reel_path = os.path.join(tmpdir, f"reel_{i+1}.mp4")
-                    success = create_reel(video_path, start, end, reel_path, video_duration=video_duration)
-                    if success:
-                        reel_paths.append(reel_path)
-                        quality = evaluate_reel_quality(reel_path, start, end)
-                        quality_reports.append(quality)
-                        st.video(reel_path)
-                        with open(reel_path, 'rb') as f:
-                            st.download_button(
-                                f"⬇️ Download Reel {i+1}", 
-                                f.read(), 
-                                file_name=f"reel_{i+1}.mp4",
-                                key=f"download_reel_{i+1}"
-                            )
-                    progress_bar.progress((i + 1) / len(timestamps))
-                
-                st.success("✅ All reels processed!")
-                
-                # Save to history
-                user = st.session_state.get('user')
-                if user:
-                    save_processing_history(user['id'], video_name, video_duration, len(reel_paths))
-                
-                if len(reel_paths) > 1:
-                    zip_path = create_download_zip(reel_paths, tmpdir)
-                    with open(zip_path, "rb") as f:
-                        st.download_button(
-                            "⬇️ Download All Reels (ZIP)", 
-                            f.read(), 
-                            file_name="video_reels.zip",
-                            key="download_all_reels"
-                        )
+            gpt_response, calls = complete_prompt(prompt)
+            timestamps = extract_timestamps_from_gpt_response(gpt_response, video_duration, on_warning)
+    except Exception as e:
+        if not candidates:
+            raise
+        gpt_response = f"GPT unavailable ({e}); using the highest-scoring audio and scene windows."
+        calls = []
+        timestamps = []
+    if not timestamps and candidates:
+        return {'timestamps': timestamps_from_candidates(candidates, transcript), 'gpt_response': gpt_response,
+                'calls': calls, 'source': 'prescore'}
+    return {'timestamps': timestamps, 'gpt_response': gpt_response, 'calls': calls, 'source': 'llm'}
+
+JOBS_DIR = os.getenv("REELIFY_JOBS_DIR", "reelify_jobs")
+JOB_WORKERS = int(os.getenv("REELIFY_JOB_WORKERS", "2"))
+JOB_MAX_PER_USER = int(os.getenv("REELIFY_JOB_MAX_PER_USER", "2"))
+JOB_MAX_ACTIVE = int(os.getenv("REELIFY_JOB_MAX_ACTIVE", "8"))
+JOB_POLL_SECONDS = float(os.getenv("REELIFY_JOB_POLL_SECONDS", "2"))
+SCRATCH_DIR = os.getenv("REELIFY_SCRATCH_DIR") or os.path.join(JOBS_DIR, ".scratch")
+SCRATCH_STALE_SECONDS = float(os.getenv("REELIFY_SCRATCH_STALE_SECONDS", "86400"))
+WORKSPACE_QUOTA_MB = int(os.getenv("REELIFY_WORKSPACE_QUOTA_MB", "20480"))
+
+@st.cache_resource
+def _workspace_state():
+    """Open-handle counts per job workspace and usage counters; clears scratch left behind by dead processes"""
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    cutoff = time.time() - SCRATCH_STALE_SECONDS
+    for name in os.listdir(SCRATCH_DIR):
+        path = os.path.join(SCRATCH_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+    return {'lock': threading.Lock(), 'quota_lock': threading.Lock(), 'refs': {}, 'created': 0,
+            'evictions': 0, 'evicted_bytes': 0}
+
+@contextmanager
+def open_workspace(job_id):
+    """Reference-counted handle on a job's workspace; its scratch files are deleted when the last handle closes"""
+    state = _workspace_state()
+    with state['lock']:
+        state['refs'][job_id] = state['refs'].get(job_id, 0) + 1
+    handle = {'job_id': job_id, 'dir': os.path.abspath(os.path.join(JOBS_DIR, job_id)),
+              'scratch': os.path.abspath(os.path.join(SCRATCH_DIR, job_id))}
+    try:
+        yield handle
+    finally:
+        with state['lock']:
+            state['refs'][job_id] -= 1
+            last = state['refs'][job_id] == 0
+            if last:
+                del state['refs'][job_id]
+        if last:
+            shutil.rmtree(handle['scratch'], ignore_errors=True)
+            touch_workspace(job_id)
+            enforce_workspace_quota()
+
+def workspace_dir(handle):
+    """Directory for a job's kept artifacts, created on first use"""
+    if not os.path.isdir(handle['dir']):
+        os.makedirs(handle['dir'], exist_ok=True)
+        state = _workspace_state()
+        with state['lock']:
+            state['created'] += 1
+    return handle['dir']
+
+def scratch_dir(handle):
+    """Directory on the scratch volume for a job's intermediate files, created on first use"""
+    os.makedirs(handle['scratch'], exist_ok=True)
+    return handle['scratch']
+
+@contextmanager
+def scratch_space(name):
+    """Private scratch directory for work outside the job queue (the batch CLI), deleted on exit.
+
+    Unlike open_workspace it does no quota cleanup, so it never touches the jobs database.
+    """
+    path = os.path.abspath(os.path.join(SCRATCH_DIR, f"{name}-{uuid.uuid4().hex[:8]}"))
+    os.makedirs(path, exist_ok=True)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def touch_workspace(job_id):
+    """Mark a job's workspace as recently used so quota cleanup removes it last"""
+    try:
+        os.utime(os.path.join(JOBS_DIR, job_id))
+    except OSError:
+        pass
+
+def _workspace_entries():
+    """(last used, path, bytes) for every job workspace"""
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    entries = []
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        if not name.startswith('.') and os.path.isdir(path):
+            entries.append((os.path.getmtime(path), path, _dir_size(path)))
+    return entries
+
+def enforce_workspace_quota(max_mb=None):
+    """Delete the least recently used job workspaces, cache entries and stored media until everything Reelify
+    keeps on disk fits the quota; workspaces of active jobs, media being fetched and scratch files are kept.
+
+    Entries that would free nothing, because their files are hard-linked from elsewhere, go last.
+    """
+    max_bytes = (WORKSPACE_QUOTA_MB if max_mb is None else max_mb) * 1024 * 1024
+    state = _workspace_state()
+    cache_state = _result_cache_state()
+    ingest_state = _ingest_state()
+    with state['quota_lock']:
+        total = _dir_size(JOBS_DIR, SCRATCH_DIR, RESULT_CACHE_DIR, LLM_CACHE_DIR, MEDIA_STORE_DIR)
+        if total <= max_bytes:
+            return
+        entries = [(used, 'workspace', path) for used, path, _ in _workspace_entries()]
+        with cache_state['lock']:
+            entries += [(used, 'cache', path) for used, path, _ in _result_cache_entries()]
+        if os.path.isdir(MEDIA_STORE_DIR):
+            with ingest_state['lock']:
+                entries += [(used, 'media', path) for used, path, _ in _media_store_entries()]
+        active = {job['id'] for job in get_jobs_in_states(ACTIVE_JOB_STATES)}
+        removed = set()
+        for shared_last in (True, False):
+            for _, kind, path in sorted(entries):
+                if total <= max_bytes:
+                    return
+                if path in removed:
+                    continue
+                expired = None
+                if kind == 'workspace':
+                    name = os.path.basename(path)
+                    with state['lock']:
+                        if name in state['refs'] or name in active:
+                            continue
+                        freed = _reclaimable_bytes(path)
+                        if shared_last and not freed:
+                            continue
+                        shutil.rmtree(path, ignore_errors=True)
+                    expired = name
+                elif kind == 'cache':
+                    with cache_state['lock']:
+                        if not os.path.exists(path):
+                            continue
+                        freed = _reclaimable_bytes(path)
+                        if shared_last and not freed:
+                            continue
+                        _remove_result_cache_entry(cache_state, path)
+                else:
+                    with ingest_state['lock']:
+                        if path in _media_store_busy(ingest_state):
+                            continue
+                        freed = _reclaimable_bytes(path)
+                        if shared_last and not freed:
+                            continue
+                        _remove_media_store_entry(ingest_state, path)
+                removed.add(path)
+                with state['lock']:
+                    state['evictions'] += 1
+                    state['evicted_bytes'] += freed
+                total -= freed
+                if expired and get_job(expired):
+                    update_job(expired, state='expired', stage=None,
+                               message='The files for this video were removed to free disk space. '
+                                       'Please submit it again.')
+
+def workspace_usage():
+    """Disk used by job workspaces, scratch files, the result cache and the media store, the total counted
+    against the quota (hard-linked files once), open handles and cleanup counters"""
+    state = _workspace_state()
+    workspaces = [path for _, path, _ in _workspace_entries()]
+    with state['lock']:
+        return {
+            'workspaces': len(workspaces),
+            'workspace_bytes': _dir_size(*workspaces),
+            'scratch_bytes': _dir_size(SCRATCH_DIR),
+            'cache_bytes': _dir_size(RESULT_CACHE_DIR, LLM_CACHE_DIR),
+            'media_bytes': _dir_size(MEDIA_STORE_DIR),
+            'disk_bytes': _dir_size(JOBS_DIR, SCRATCH_DIR, RESULT_CACHE_DIR, LLM_CACHE_DIR, MEDIA_STORE_DIR),
+            'quota_bytes': WORKSPACE_QUOTA_MB * 1024 * 1024,
+            'open_handles': sum(state['refs'].values()),
+            'created': state['created'],
+            'evictions': state['evictions'],
+            'evicted_bytes': state['evicted_bytes'],
+        }
+
+def _link_or_copy(source_path, target_path):
+    """Hard-link a cached artifact into a job directory, copying when links aren't possible"""
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+    return target_path
+
+@contextmanager
+def _job_stage(job_id, timings, stage, message, progress, trace=None):
+    update_job(job_id, stage=stage, message=message, progress=progress)
+    span = {}
+    try:
+        with trace_span(trace if trace is not None else [], stage) as span:
+            yield span
+    finally:
+        timings[stage] = round(timings.get(stage, 0) + span.get('wall_seconds', 0), 3)
+        update_job(job_id, stage_timings=timings)
+
+def run_pipeline(job_id):
+    """Run every processing stage for a job, recording progress, timings and artifacts in the jobs table"""
+    memory = {}
+    with open_workspace(job_id) as workspace, track_memory(memory):
+        _run_pipeline(job_id, workspace, memory)
+
+def _run_pipeline(job_id, workspace, memory):
+    job = get_job(job_id)
+    workdir = workspace_dir(workspace)
+    scratch = scratch_dir(workspace)
+    timings = {}
+    trace = []
+    result = {}
+    update_job(job_id, state='running', message='Starting...', error=None)
+    try:
+        video_path = job['source']
+        video_name = job['video_name']
+        audio_source = video_path
+        video_future = None
+        known_duration = None
+        if job['source_type'] == 'url':
+            with _job_stage(job_id, timings, "download", "Downloading from YouTube...", 0.02, trace):
+                ingest = ingest_youtube_video(job['source'])
+                video_name = ingest['title']
+                update_job(job_id, video_name=video_name)
+                known_duration = ingest['duration']
+                video_future = ingest['video']
+                if ingest['audio_path']:
+                    audio_source = ingest['audio_path']
+                else:
+                    video_path = audio_source = _link_or_copy(video_future.result(), os.path.join(workdir, "input_video.mp4"))
+                    video_future = None
+            # the store is keyed by video ID, so the ID addresses the content without hashing the file
+            content_key = hashlib.sha256(f"ingest:{ingest['store_dir']}".encode('utf-8')).hexdigest()
+        else:
+            content_key = job['result'].get('content_key') or hash_file(video_path)
+        result['video_name'] = video_name
+        if not video_future:
+            result['video_path'] = video_path
+
+        with _job_stage(job_id, timings, "audio", "Extracting audio...", 0.1, trace):
+            audio_entry = cache_get(content_key, "audio_preview", {'format': 'm4a', 'bitrate': '64k'})
+            if not audio_entry:
+                preview_path = create_audio_preview(audio_source, os.path.join(scratch, "audio_preview.m4a"))
+                audio_entry = cache_put(content_key, "audio_preview", {'format': 'm4a', 'bitrate': '64k'},
+                                        files={'audio_preview.m4a': preview_path})
+            result['audio_preview'] = _link_or_copy(os.path.join(audio_entry, "audio_preview.m4a"),
+                                                    os.path.join(workdir, "audio_preview.m4a"))
+
+        with _job_stage(job_id, timings, "duration", "Getting video duration...", 0.15, trace):
+            duration_entry = cache_get(content_key, "duration", {})
+            if duration_entry:
+                video_duration = cache_load_json(duration_entry)['duration']
+            elif known_duration:
+                video_duration = float(known_duration)
             else:
-                st.warning("No valid timestamps found. GPT output may be malformed.")
-        except Exception as e:
-            st.error(f"❌ Error occurred: {e}")
-            import traceback
-            st.error(f"Full error: {traceback.format_exc()}")
-        finally:
+                video_duration = probe_media(audio_source)['duration']
+                cache_put(content_key, "duration", {}, data={'duration': video_duration})
+            result['duration'] = video_duration
+
+        # 16 kHz samples decoded once, on first use, for both transcription and loudness scoring
+        decoded = {}
+
+        def decoded_audio():
+            if 'samples' not in decoded:
+                decoded['samples'] = decode_audio(audio_source, video_duration, scratch)
+            return decoded['samples']
+
+        with _job_stage(job_id, timings, "transcribe", "Transcribing audio...", 0.2, trace):
+            transcribe_params = {'model': WHISPER_MODEL_SIZE, 'chunk_seconds': TRANSCRIBE_CHUNK_SECONDS,
+                                 'chunked': TRANSCRIBE_WORKERS > 1}
+            transcript_entry = cache_get(content_key, "transcript", transcribe_params)
+            if transcript_entry:
+                whisper_result = cache_load_json(transcript_entry)
+            else:
+                def report_partial_transcript(done, total, partial):
+                    update_job(job_id, message=f"Transcribed {done}/{total} chunks...",
+                               progress=0.2 + 0.3 * done / total,
+                               result=dict(result, partial_transcript=partial['text']))
+
+                whisper_result = transcribe_media(
+                    audio_source, video_duration, on_chunk=report_partial_transcript, workdir=scratch,
+                    samples=None if transcribe_in_chunks(video_duration) else decoded_audio())
+                cache_put(content_key, "transcript", transcribe_params, data=whisper_result)
+            transcript = whisper_result["text"]
+            result['transcript'] = transcript
+
+        structured_transcript = build_transcript(whisper_result)
+        with _job_stage(job_id, timings, "prescore", "Scoring audio energy and scene changes...", 0.48, trace):
+            prescore_params = {'model': WHISPER_MODEL_SIZE, 'window': PRESCORE_WINDOW_SECONDS, 'hop': PRESCORE_HOP_SECONDS,
+                               'top_n': PRESCORE_TOP_N, 'scenes': SCENE_THRESHOLD if SCENE_DETECT and not video_future else None}
+            prescore_entry = cache_get(content_key, "prescore", prescore_params)
+            if prescore_entry:
+                candidates = cache_load_json(prescore_entry)['candidates']
+            else:
+                try:
+                    candidates = prescore_highlight_windows(audio_source, structured_transcript, video_duration,
+                                                            video_path=None if video_future else video_path,
+                                                            samples=decoded_audio())
+                    cache_put(content_key, "prescore", prescore_params, data={'candidates': candidates})
+                except Exception:
+                    candidates = []
+            result['candidates'] = candidates
+            decoded.clear()
+
+        with _job_stage(job_id, timings, "highlights", "Sending to GPT...", 0.5, trace):
+            highlights = choose_highlights(whisper_result, video_duration, candidates,
+                                           on_warning=result.setdefault('warnings', []).append)
+            timestamps = highlights['timestamps']
+            result['highlight_source'] = highlights['source']
+            result['gpt_response'] = highlights['gpt_response']
+            result['llm'] = summarize_llm_calls(highlights['calls'])
+
+        if video_future:
+            with _job_stage(job_id, timings, "download_video", "Waiting for the video download to finish...", 0.58,
+                            trace):
+                video_path = _link_or_copy(video_future.result(), os.path.join(workdir, "input_video.mp4"))
+                result['video_path'] = video_path
+
+        reels = []
+        renditions = profile_renditions()
+        multi_format = not is_default_output(renditions)
+        with _job_stage(job_id, timings, "render", f"Creating {len(timestamps)} reel(s)...", 0.6, trace):
+            reel_params = [{'start': start, 'end': end, 'max_duration': 30, 'backend': REEL_RENDER_BACKEND,
+                            'preset': REEL_ENCODER_PRESET, 'crf': REEL_ENCODER_CRF}
+                           for start, end in timestamps]
+            if multi_format:
+                for params in reel_params:
+                    params['renditions'] = renditions
+            reel_entries = [cache_get(content_key, "reel", params) for params in reel_params]
+            errors = {}
+            missing = [i for i, entry in enumerate(reel_entries) if not entry]
+            source_frame_rate = probe_media(video_path)['frame_rate'] if missing else None
+            if missing:
+                def report_render_progress(done, total, render_result):
+                    update_job(job_id, message=f"Created reel {done}/{total}...", progress=0.6 + 0.35 * done / total)
+
+                render_results = render_reels(
+                    video_path,
+                    [timestamps[i] for i in missing],
+                    [os.path.join(scratch, f"render_{i+1}.mp4") for i in missing],
+                    video_duration=video_duration,
+                    on_progress=report_render_progress,
+                    renditions=renditions
+                )
+                for i, render_result in zip(missing, render_results):
+                    if render_result.get('metrics'):
+                        trace.append(dict(render_result['metrics'], stage="create_reel", item=i + 1))
+                    if render_result['success'] and multi_format:
+                        qualities = {}
+                        with trace_span(trace, "evaluate_reel_quality", i + 1):
+                            for rendition in renditions:
+                                qualities[rendition['key']] = evaluate_reel_quality(
+                                    render_result['renditions'][rendition['key']], render_result['start'],
+                                    render_result['end'], expected_frame_rate=source_frame_rate,
+                                    expected_resolution=(rendition['width'], rendition['height']))
+                        quality = dict(qualities[renditions[0]['key']], renditions=qualities)
+                        reel_entries[i] = cache_put(content_key, "reel", reel_params[i], data=quality, files={
+                            f"{key}.mp4": path for key, path in render_result['renditions'].items()})
+                    elif render_result['success']:
+                        with trace_span(trace, "evaluate_reel_quality", i + 1):
+                            quality = evaluate_reel_quality(render_result['path'], render_result['start'],
+                                                            render_result['end'], expected_frame_rate=source_frame_rate)
+                        reel_entries[i] = cache_put(content_key, "reel", reel_params[i],
+                                                    files={'reel.mp4': render_result['path']}, data=quality)
+                    else:
+                        errors[i] = render_result['error']
+            for i, (start, end) in enumerate(timestamps):
+                reel = {'number': i + 1, 'start': start, 'end': end, 'path': None, 'quality': None,
+                        'error': errors.get(i), 'renditions': []}
+                if reel_entries[i]:
+                    reel['quality'] = cache_load_json(reel_entries[i])
+                    for key, rendition_quality in (reel['quality'].get('renditions') or {}).items():
+                        reel['renditions'].append({
+                            'key': key, 'quality': rendition_quality,
+                            'path': _link_or_copy(os.path.join(reel_entries[i], f"{key}.mp4"),
+                                                  os.path.join(workdir, f"reel_{i+1}_{key}.mp4"))})
+                    reel['path'] = reel['renditions'][0]['path'] if reel['renditions'] else _link_or_copy(
+                        os.path.join(reel_entries[i], "reel.mp4"), os.path.join(workdir, f"reel_{i+1}.mp4"))
+                reels.append(reel)
+            result['reels'] = reels
+
+        reel_paths = [reel['path'] for reel in reels if reel['path']]
+        zip_entries = [(rendition['path'], f"reel_{reel['number']}_{rendition['key']}.mp4")
+                       for reel in reels for rendition in reel['renditions']]
+        if len(reel_paths) > 1 or len(zip_entries) > 1:
+            with _job_stage(job_id, timings, "zip", "Packaging reels...", 0.97, trace):
+                if zip_entries:
+                    result['zip_path'] = create_download_zip([path for path, _ in zip_entries], workdir,
+                                                             [name for _, name in zip_entries])
+                else:
+                    result['zip_path'] = create_download_zip(reel_paths, workdir)
+
+        save_processing_history(job['user_id'], video_name, video_duration, len(reel_paths), job_id)
+        # sampled current RSS rather than ru_maxrss, which never falls and so can't show one job's usage
+        result['rss_peak_mb'] = memory['rss_peak_mb']
+        result['rss_growth_mb'] = memory['rss_growth_mb']
+        save_stage_metrics(job_id, job['user_id'], trace)
+        update_job(job_id, state='done', stage=None, message='All reels processed!', progress=1.0, result=result)
+    except Exception as e:
+        try:
+            save_stage_metrics(job_id, job['user_id'], trace)
+        except Exception:
+            pass
+        update_job(job_id, state='failed', message='Processing failed', result=result,
+                   error=f"{e}\n\n{traceback.format_exc()}")
+
+@st.cache_resource
+def _job_executor():
+    """Process-wide worker pool for pipeline jobs; requeues work left over from a previous run"""
+    executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="reelify-job")
+    for job in get_jobs_in_states(('running',)):
+        update_job(job['id'], state='failed', message='Interrupted by a server restart',
+                   error='The server restarted while this job was running. Please submit the video again.')
+    for job in get_jobs_in_states(('queued',)):
+        executor.submit(run_pipeline, job['id'])
+    return executor
+
+def _job_limit_reason(conn, user_id):
+    if count_active_jobs(user_id, conn) >= JOB_MAX_PER_USER:
+        return f"You already have {JOB_MAX_PER_USER} videos processing. Please wait for one to finish."
+    if count_active_jobs(None, conn) >= JOB_MAX_ACTIVE:
+        return "The server is busy processing other videos. Please try again in a few minutes."
+    return ""
+
+def can_submit_job(user_id):
+    """Check the per-user and global concurrent job limits (submit_job checks them again atomically)"""
+    with db_connection() as conn:
+        reason = _job_limit_reason(conn, user_id)
+    return not reason, reason
+
+def submit_job(user_id, video_name, source_type, source=None, uploaded_file=None):
+    """Create a job directory, store the input and queue the pipeline; returns the job id.
+
+    Raises JobLimitError when the user or the server already has the maximum number of active jobs.
+    """
+    # start the executor first: its startup recovery requeues every queued job, which must not include this one
+    executor = _job_executor()
+    job_id = uuid.uuid4().hex
+    content_key = None
+    # the handle keeps quota cleanup away from the upload until the queued job row protects it
+    with open_workspace(job_id) as workspace:
+        if uploaded_file is not None:
+            source = os.path.join(workspace_dir(workspace), "input_video.mp4")
+            content_key = copy_upload_to_disk(uploaded_file, source)
+        try:
+            create_job(job_id, user_id, video_name, source, source_type, workspace['dir'], enforce_limits=True)
+        except JobLimitError:
+            shutil.rmtree(workspace['dir'], ignore_errors=True)
+            raise
+        if content_key:
+            update_job(job_id, result={'content_key': content_key})
+    executor.submit(run_pipeline, job_id)
+    return job_id
+
+DOWNLOAD_PORT = int(os.getenv("REELIFY_DOWNLOAD_PORT", "8502"))
+# browsers must be able to reach the server, so links are only handed out for an explicitly configured URL
+DOWNLOAD_BASE_URL = (os.getenv("REELIFY_DOWNLOAD_BASE_URL") or "").rstrip('/')
+INLINE_DOWNLOAD_MAX_MB = float(os.getenv("REELIFY_INLINE_DOWNLOAD_MAX_MB", "200"))
+
+METRICS_TOKEN = os.getenv("REELIFY_METRICS_TOKEN") or None
+PROMETHEUS_METRICS = (
+    ('runs', 'reelify_stage_runs_total', 'counter', "Recorded executions of each pipeline stage"),
+    ('wall_seconds', 'reelify_stage_wall_seconds_total', 'counter', "Wall-clock seconds spent in each stage"),
+    ('cpu_seconds', 'reelify_stage_cpu_seconds_total', 'counter', "CPU seconds of the pipeline thread in each stage"),
+    ('child_cpu_seconds', 'reelify_stage_child_cpu_seconds_total', 'counter',
+     "CPU seconds of subprocesses such as ffmpeg reaped during each stage"),
+    ('read_bytes', 'reelify_stage_read_bytes_total', 'counter', "Bytes read by the pipeline thread in each stage"),
+    ('write_bytes', 'reelify_stage_write_bytes_total', 'counter', "Bytes written by the pipeline thread in each stage"),
+    ('peak_rss_mb', 'reelify_stage_peak_rss_megabytes', 'gauge', "Largest process peak RSS seen at the end of each stage"),
+    ('child_peak_rss_mb', 'reelify_stage_child_peak_rss_megabytes', 'gauge',
+     "Largest subprocess peak RSS seen at the end of each stage"),
+)
+
+def stage_metrics_prometheus(totals, job_id=None):
+    """Prometheus text exposition of get_stage_metric_totals rows, labelled by stage (and job when given)"""
+    lines = []
+    for field, name, kind, description in PROMETHEUS_METRICS:
+        samples = [(row['stage'], row[field]) for row in totals if row[field] is not None]
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for stage, value in samples:
+            labels = f'stage="{stage}"' + (f',job_id="{job_id}"' if job_id else '')
+            lines.append(f"{name}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+WORKSPACE_PROMETHEUS_METRICS = (
+    ('workspaces', 'reelify_workspaces', 'gauge', "Job workspaces on disk"),
+    ('workspace_bytes', 'reelify_workspace_bytes', 'gauge', "Bytes used by job workspaces"),
+    ('scratch_bytes', 'reelify_scratch_bytes', 'gauge', "Bytes used by intermediate files on the scratch volume"),
+    ('cache_bytes', 'reelify_cache_bytes', 'gauge', "Bytes used by the result and LLM caches"),
+    ('media_bytes', 'reelify_media_store_bytes', 'gauge', "Bytes used by the media store"),
+    ('disk_bytes', 'reelify_disk_bytes', 'gauge', "Bytes counted against the quota, hard-linked files once"),
+    ('quota_bytes', 'reelify_workspace_quota_bytes', 'gauge', "Disk quota for workspaces, caches and stored media"),
+    ('open_handles', 'reelify_workspace_open_handles', 'gauge', "Open workspace handles"),
+    ('created', 'reelify_workspaces_created_total', 'counter', "Job workspaces created"),
+    ('evictions', 'reelify_workspace_evictions_total', 'counter',
+     "Workspaces, cache entries and stored media removed to stay within the quota"),
+    ('evicted_bytes', 'reelify_workspace_evicted_bytes_total', 'counter', "Bytes freed by quota cleanup"),
+)
+
+def workspace_metrics_prometheus(usage):
+    """Prometheus text exposition of workspace_usage()"""
+    lines = []
+    for field, name, kind, description in WORKSPACE_PROMETHEUS_METRICS:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {usage[field]}")
+    return "\n".join(lines) + "\n"
+
+def whisper_metrics_prometheus(stats):
+    """Prometheus text exposition of whisper_model_stats()"""
+    lines = []
+    for field, description in (('hits', "Whisper model requests served from the registry"),
+                               ('misses', "Whisper model requests that loaded a model"),
+                               ('evictions', "Whisper models evicted to stay within the memory budget")):
+        lines.append(f"# HELP reelify_whisper_{field}_total {description}")
+        lines.append(f"# TYPE reelify_whisper_{field}_total counter")
+        lines.append(f"reelify_whisper_{field}_total {stats[field]}")
+    lines.append("# HELP reelify_whisper_load_seconds Seconds the last load of each model took")
+    lines.append("# TYPE reelify_whisper_load_seconds gauge")
+    for model, seconds in stats['load_seconds'].items():
+        lines.append(f'reelify_whisper_load_seconds{{model="{model}"}} {seconds}')
+    lines.append("# HELP reelify_whisper_model_megabytes Parameter memory of each resident model")
+    lines.append("# TYPE reelify_whisper_model_megabytes gauge")
+    for loaded in stats['loaded']:
+        lines.append(f'reelify_whisper_model_megabytes{{model="{loaded["model"]}@{loaded["device"]}"}} '
+                     f'{loaded["size_mb"]}')
+    return "\n".join(lines) + "\n"
+
+def result_cache_metrics_prometheus(stats):
+    """Prometheus text exposition of result_cache_stats(), labelled by stage"""
+    lines = []
+    for field, description in (('hits', "Pipeline stages served from the result cache"),
+                               ('misses', "Pipeline stages that had to be computed")):
+        lines.append(f"# HELP reelify_result_cache_{field}_total {description}")
+        lines.append(f"# TYPE reelify_result_cache_{field}_total counter")
+        for stage, counters in stats['stages'].items():
+            lines.append(f'reelify_result_cache_{field}_total{{stage="{stage}"}} {counters[field]}')
+    lines.append("# HELP reelify_result_cache_evictions_total Cache entries removed to stay within the size cap")
+    lines.append("# TYPE reelify_result_cache_evictions_total counter")
+    lines.append(f"reelify_result_cache_evictions_total {stats['evictions']}")
+    return "\n".join(lines) + "\n"
+
+def probe_cache_metrics_prometheus(stats):
+    """Prometheus text exposition of probe_cache_stats()"""
+    lines = []
+    for field, description in (('hits', "Media probes served from the probe cache"),
+                               ('misses', "Media probes that ran ffprobe")):
+        lines.append(f"# HELP reelify_probe_cache_{field}_total {description}")
+        lines.append(f"# TYPE reelify_probe_cache_{field}_total counter")
+        lines.append(f"reelify_probe_cache_{field}_total {stats[field]}")
+    lines.append("# HELP reelify_probe_cache_entries Media files with cached probe results")
+    lines.append("# TYPE reelify_probe_cache_entries gauge")
+    lines.append(f"reelify_probe_cache_entries {stats['entries']}")
+    return "\n".join(lines) + "\n"
+
+def stage_metrics_json(job_id):
+    return json.dumps({'job_id': job_id, 'stages': get_stage_metrics(job_id),
+                       'totals': get_stage_metric_totals(job_id)}, indent=2)
+
+class _ArtifactRequestHandler(BaseHTTPRequestHandler):
+    """Streams job artifacts from disk in chunks, with Range support for video seeking"""
+    root = None
+    secret = None
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == '/metrics':
+            if not METRICS_TOKEN:
+                self.send_error(404)
+                return
+            if not hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+                self.send_error(401)
+                return
+            payload = (stage_metrics_prometheus(get_stage_metric_totals())
+                       + workspace_metrics_prometheus(workspace_usage())
+                       + whisper_metrics_prometheus(whisper_model_stats())
+                       + result_cache_metrics_prometheus(result_cache_stats())
+                       + probe_cache_metrics_prometheus(probe_cache_stats())).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        token, _, relative_path = parts.path.lstrip('/').partition('/')
+        relative_path = unquote(relative_path)
+        if not hmac.compare_digest(token, _artifact_token(self.secret, relative_path)):
+            self.send_error(403)
+            return
+        path = os.path.realpath(os.path.join(self.root, relative_path))
+        if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range', '')
+        match = re.match(r'bytes=(\d*)-(\d*)$', range_header)
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        content_type = {'.mp4': 'video/mp4', '.m4a': 'audio/mp4', '.zip': 'application/zip'}.get(
+            os.path.splitext(path)[1].lower(), 'application/octet-stream')
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if 'download=1' in parts.query:
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(path)}"')
+        self.end_headers()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(IO_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+def _artifact_token(secret, relative_path):
+    return hmac.new(secret.encode('utf-8'), relative_path.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+@st.cache_resource
+def _download_server():
+    """Background HTTP server for job artifacts and /metrics; None when neither is configured or the port is taken"""
+    if DOWNLOAD_PORT <= 0 or not (DOWNLOAD_BASE_URL or METRICS_TOKEN):
+        return None
+    root = os.path.realpath(JOBS_DIR)
+    os.makedirs(root, exist_ok=True)
+    secret = os.getenv("REELIFY_DOWNLOAD_SECRET") or uuid.uuid4().hex
+    handler = type('ArtifactRequestHandler', (_ArtifactRequestHandler,), {'root': root, 'secret': secret})
+    try:
+        server = ThreadingHTTPServer(('0.0.0.0', DOWNLOAD_PORT), handler)
+    except OSError:
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="reelify-downloads").start()
+    return {'server': server, 'root': root, 'secret': secret}
+
+def artifact_url(path, download=False):
+    """Signed streaming URL for a file under the jobs directory, or None if it can't be served that way"""
+    server = _download_server()
+    if not server or not path or not DOWNLOAD_BASE_URL:
+        return None
+    path = os.path.realpath(path)
+    if not path.startswith(server['root'] + os.sep):
+        return None
+    relative_path = os.path.relpath(path, server['root']).replace(os.sep, '/')
+    url = f"{DOWNLOAD_BASE_URL}/{_artifact_token(server['secret'], relative_path)}/{quote(relative_path)}"
+    return url + "?download=1" if download else url
+
+def show_download_button(label, path, file_name, key):
+    """Link to the streaming endpoint, falling back to a Streamlit download button for files small enough to hold"""
+    url = artifact_url(path, download=True)
+    if url:
+        st.link_button(label, url)
+        return
+    # st.download_button keeps the whole payload in memory whatever it is given, so only small files go inline
+    if os.path.getsize(path) > INLINE_DOWNLOAD_MAX_MB * 1024 * 1024:
+        st.caption(f"{file_name} is too large to download through the page; set REELIFY_DOWNLOAD_BASE_URL "
+                   f"to serve it from the download server.")
+        return
+    with open(path, 'rb') as f:
+        st.download_button(label, f.read(), file_name=file_name, key=key)
+
+def show_job(job):
+    """Render a job's progress or its finished results"""
+    if job['state'] in ACTIVE_JOB_STATES:
+        st.progress(min(max(job['progress'] or 0.0, 0.0), 1.0), text=job['message'] or "Processing...")
+        partial = job['result'].get('partial_transcript')
+        if partial:
+            st.caption(partial[:2000])
+    elif job['state'] == 'failed':
+        st.error(f"❌ Error occurred: {job['error']}")
+    elif job['state'] == 'expired':
+        st.info(job['message'])
+
+    result = job['result']
+    if job['state'] == 'done':
+        touch_workspace(job['id'])
+        if result.get('video_path') and os.path.exists(result['video_path']):
+            st.video(artifact_url(result['video_path']) or result['video_path'])
+        if result.get('audio_preview') and os.path.exists(result['audio_preview']):
+            st.audio(artifact_url(result['audio_preview']) or result['audio_preview'])
+        video_duration = result.get('duration') or 0
+        st.info(f"🎥 Video Duration: {int(video_duration // 60):02d}:{int(video_duration % 60):02d}")
+
+        st.markdown("### 📝 Transcript")
+        st.write(result.get('transcript', ''))
+
+        st.markdown("### 🎯 Highlighted Segments")
+        st.text(result.get('gpt_response', ''))
+        for warning in result.get('warnings') or []:
+            st.warning(warning)
+        llm_summary = result.get('llm')
+        if llm_summary:
+            st.caption(f"GPT: {llm_summary['calls']} call(s), {llm_summary['cached']} cached, "
+                       f"{llm_summary['prompt_tokens'] + llm_summary['completion_tokens']} tokens, "
+                       f"{llm_summary['latency_seconds']}s")
+        if result.get('highlight_source') == 'prescore':
+            st.warning("⚠️ GPT gave no usable highlights; these reels come from local audio-energy and scene scoring.")
+        candidates = result.get('candidates') or []
+        if candidates:
+            with st.expander("📈 Pre-scored windows"):
+                for candidate in candidates:
+                    start, end = int(candidate['start']), int(candidate['end'])
+                    st.write(f"{start // 60:02d}:{start % 60:02d} - {end // 60:02d}:{end % 60:02d}: "
+                             f"score {candidate['score']}, {candidate['loudness_db']} dB, "
+                             f"{candidate['words_per_second']} words/s, {candidate['scene_cuts']} cut(s)")
+
+        reels = result.get('reels') or []
+        if reels:
+            st.markdown("## 🎞️ Reel Creation")
+            for reel in reels:
+                if reel['error']:
+                    st.error(f"❌ Error creating reel {reel['number']}: {reel['error']}")
+                if not reel['path'] or not os.path.exists(reel['path']):
+                    continue
+                st.video(artifact_url(reel['path']) or reel['path'])
+                if reel.get('renditions'):
+                    for rendition in reel['renditions']:
+                        show_download_button(f"⬇️ Download Reel {reel['number']} ({rendition['key']})",
+                                             rendition['path'], f"reel_{reel['number']}_{rendition['key']}.mp4",
+                                             f"download_reel_{job['id']}_{reel['number']}_{rendition['key']}")
+                        for issue in rendition['quality']['issues']:
+                            st.caption(f"⚠️ {rendition['key']}: {issue}")
+                else:
+                    show_download_button(f"⬇️ Download Reel {reel['number']}", reel['path'],
+                                         f"reel_{reel['number']}.mp4", f"download_reel_{job['id']}_{reel['number']}")
+            st.success("✅ All reels processed!")
+            if result.get('zip_path') and os.path.exists(result['zip_path']):
+                show_download_button("⬇️ Download All Reels (ZIP)", result['zip_path'],
+                                     "video_reels.zip", f"download_all_reels_{job['id']}")
+        else:
+            st.warning("No valid timestamps found. GPT output may be malformed.")
+
+    stage_metrics = get_stage_metrics(job['id']) if job['state'] not in ACTIVE_JOB_STATES else []
+    if stage_metrics:
+        with st.expander("⏱️ Stage timings"):
+            st.text(f"{'stage':<26} {'wall s':>8} {'cpu s':>8} {'child s':>8} {'peak MB':>8} {'read MB':>8} {'write MB':>8}")
+            for span in stage_metrics:
+                name = f"{span['stage']} #{span['item']}" if span['item'] else span['stage']
+                cells = [f"{span[field]:>8.2f}" if span[field] is not None else f"{'-':>8}"
+                         for field in ('wall_seconds', 'cpu_seconds', 'child_cpu_seconds', 'peak_rss_mb')]
+                cells += [f"{span[field] / (1024 * 1024):>8.1f}" if span[field] is not None else f"{'-':>8}"
+                          for field in ('read_bytes', 'write_bytes')]
+                st.text(f"{name:<26} {' '.join(cells)}")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("Export JSON", stage_metrics_json(job['id']),
+                                   file_name=f"reelify_{job['id']}_metrics.json", mime="application/json",
+                                   key=f"metrics_json_{job['id']}")
+            with col2:
+                st.download_button("Export Prometheus", stage_metrics_prometheus(get_stage_metric_totals(job['id']),
+                                                                                 job['id']),
+                                   file_name=f"reelify_{job['id']}_metrics.prom", mime="text/plain",
+                                   key=f"metrics_prom_{job['id']}")
+    elif job['stage_timings']:
+        with st.expander("⏱️ Stage timings"):
+            for stage, seconds in job['stage_timings'].items():
+                st.text(f"{stage:<12} {seconds:>8.2f}s")
+            if result.get('rss_peak_mb'):
+                st.text(f"{'peak RSS':<12} {result['rss_peak_mb']:>8.1f} MB (+{result['rss_growth_mb']:.1f} MB)")
+
+def main_app():
+    """Main application after authentication"""
+    st.title("🎬 Smart Video Processor with Reel Creation")
+    
+
+    show_user_profile()
+    
+
+    if st.session_state.get('show_history', False):
+        return
+    
+    uploaded_file = st.file_uploader("📤 Upload a video", type=["mp4", "mov", "avi"])
+    video_url = st.text_input("🔗 Or paste a YouTube video URL")
+
+    user = st.session_state['user']
+    _job_executor()
+
+    # Streamlit reruns the script on every interaction; only submit each upload or URL once
+    submission_key = None
+    if uploaded_file:
+        submission_key = f"upload:{getattr(uploaded_file, 'file_id', None) or uploaded_file.name}:{uploaded_file.size}"
+    elif video_url:
+        submission_key = f"url:{video_url}"
+    if submission_key and st.session_state.get('submitted_source') != submission_key:
+        allowed, reason = can_submit_job(user['id'])
+        if not allowed:
+            st.warning(reason)
+        else:
             try:
-                time.sleep(1)
-                gc.collect()
-                if os.path.exists(tmpdir):
-                    shutil.rmtree(tmpdir, ignore_errors=True)
-            except Exception as cleanup_error:
-                st.warning(f"⚠️ Cleanup issue: {cleanup_error}")
+                if uploaded_file:
+                    job_id = submit_job(user['id'], uploaded_file.name, 'upload', uploaded_file=uploaded_file)
+                    st.success("✅ File uploaded successfully!")
+                else:
+                    job_id = submit_job(user['id'], None, 'url', source=video_url)
+            except JobLimitError as e:
+                st.warning(str(e))
+            else:
+                st.session_state['submitted_source'] = submission_key
+                st.session_state['selected_job'] = job_id
 
+    jobs = get_user_jobs(user['id'])
+    if not jobs:
+        return
+    job_ids = [job['id'] for job in jobs]
+    selected = st.session_state.get('selected_job')
+    selected = st.selectbox(
+        "🗂️ Your videos",
+        job_ids,
+        index=job_ids.index(selected) if selected in job_ids else 0,
+        format_func=lambda job_id: next(
+            f"{job['video_name'] or job['source']} - {job['state']} ({job['created_at']})"
+            for job in jobs if job['id'] == job_id
+        ),
+    )
+    st.session_state['selected_job'] = selected
+    show_job(next(job for job in jobs if job['id'] == selected))
+
+    # the session's peak is the highest current RSS seen on its reruns and during its jobs
+    samples = [current_rss_mb(), st.session_state.get('rss_peak_mb')]
+    samples += [job['result'].get('rss_peak_mb') for job in jobs]
+    samples = [sample for sample in samples if sample]
+    if samples:
+        st.session_state['rss_peak_mb'] = max(samples)
+        st.sidebar.caption(f"Server memory: {samples[0]:.0f} MB, peak this session: {max(samples):.0f} MB")
+
+    if any(job['state'] in ACTIVE_JOB_STATES for job in jobs):
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
 
 def main():
     st.set_page_config(page_title="Smart Video Processor", layout="centered")
     
 
     init_database()
+    warm_up_whisper_models()
+    _download_server()
     
 
     if 'user' not in st.session_state:
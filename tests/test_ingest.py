@@ -0,0 +1,86 @@
+"""Ingest from a local HTTP server standing in for YouTube (yt-dlp's generic extractor downloads the file)."""
+import functools
+import os
+import shutil
+import subprocess
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+main = pytest.importorskip("main")
+pytest.importorskip("yt_dlp")
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def clip_url(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-f", "lavfi",
+                    "-i", "sine=frequency=440", "-t", "4", "-c:v", "libx264", "-c:a", "aac", "-shortest",
+                    str(served / "clip.mp4")], check=True)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=str(served)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/clip.mp4", served / "clip.mp4"
+    server.shutdown()
+
+
+@pytest.fixture
+def media_store(monkeypatch, tmp_path):
+    store = tmp_path / "media"
+    monkeypatch.setattr(main, "MEDIA_STORE_DIR", str(store))
+    return store
+
+
+def test_ingest_fills_the_store_and_reuses_it(clip_url, media_store):
+    url, source = clip_url
+    first = main.ingest_youtube_video(url)
+    video_path = first['video'].result(timeout=60)
+    assert os.path.getsize(video_path) == os.path.getsize(source)
+    assert first['audio_path'] and os.path.dirname(first['audio_path']) == first['store_dir']
+    mtime = os.path.getmtime(video_path)
+
+    second = main.ingest_youtube_video(url)
+    assert second['store_dir'] == first['store_dir']
+    assert second['video'].result(timeout=60) == video_path
+    assert second['audio_path'] is None
+    assert os.path.getmtime(video_path) == mtime
+
+
+def test_concurrent_ingests_share_the_downloads(clip_url, media_store):
+    url, source = clip_url
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(main.ingest_youtube_video(url))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(result['video']) for result in results}) == 1
+    # a job that starts after the video is already in the store skips the audio-only download
+    assert len({result['audio_path'] for result in results} - {None}) == 1
+    audio_path = next(result['audio_path'] for result in results if result['audio_path'])
+    assert os.path.getsize(audio_path) == os.path.getsize(source)
+    results[0]['video'].result(timeout=60)
+    assert not [name for name in os.listdir(results[0]['store_dir']) if name.endswith('.part')]
+
+
+def test_eviction_drops_stale_parts_and_least_recently_used_entries(media_store):
+    for n, name in enumerate(("old", "newer", "newest")):
+        entry = media_store / name
+        entry.mkdir(parents=True)
+        (entry / "video.mp4").write_bytes(b"x" * 400000)
+        os.utime(entry, (n + 1000, n + 1000))
+    stale = media_store / "newest" / "audio.m4a.part"
+    stale.write_bytes(b"x")
+    os.utime(stale, (0, 0))
+    os.utime(media_store / "newest", (2000, 2000))
+
+    main.evict_media_store(max_mb=1)
+    assert sorted(os.listdir(media_store)) == ["newer", "newest"]
+    assert not stale.exists()
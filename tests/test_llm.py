@@ -0,0 +1,102 @@
+"""Highlight selection against the local OpenAI-compatible stub (llm_stub.py)."""
+import json
+import os
+
+import pytest
+
+main = pytest.importorskip("main")
+import llm_stub
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    server, url = llm_stub.start_stub_server()
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setattr(main, "LLM_BASE_URL", url)
+    monkeypatch.setattr(main, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(main, "RESULT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(main, "LLM_CACHE_DIR", str(tmp_path / "cache" / "llm"))
+    yield server
+    server.shutdown()
+
+
+def _transcript(segments=12, seconds=5.0):
+    return main.build_transcript({'segments': [
+        {'start': i * seconds, 'end': (i + 1) * seconds, 'text': f" Sentence number {i}."} for i in range(segments)
+    ]})
+
+
+def test_select_highlights_returns_segment_ranges(stub):
+    transcript = _transcript()
+    response, calls = main.select_highlights(transcript)
+    timestamps = main.extract_segments_from_gpt_response(response, transcript)
+    assert timestamps
+    assert all(0 <= start < end <= 60 for start, end in timestamps)
+    assert len(calls) == 1 and not calls[0]['cached']
+    assert calls[0]['prompt_tokens'] > 0
+
+
+def test_repeated_prompt_is_served_from_the_cache(stub):
+    transcript = _transcript()
+    first, _ = main.select_highlights(transcript)
+    second, calls = main.select_highlights(transcript)
+    assert second == first
+    assert [call['cached'] for call in calls] == [True]
+
+
+def test_long_transcripts_are_map_reduced(stub):
+    transcript = _transcript(segments=200)
+    response, calls = main.select_highlights(transcript, budget=400)
+    assert len(calls) > 2
+    assert main.extract_segments_from_gpt_response(response, transcript)
+
+
+def test_rate_limited_requests_are_retried(stub, monkeypatch):
+    monkeypatch.setattr(main.asyncio, "sleep", _no_sleep)
+    failures = {'left': 2}
+    original = llm_stub.StubHandler.do_POST
+
+    def flaky(handler):
+        if failures['left']:
+            failures['left'] -= 1
+            handler.send_response(429)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', '2')
+            handler.end_headers()
+            handler.wfile.write(b'{}')
+            return
+        original(handler)
+
+    monkeypatch.setattr(llm_stub.StubHandler, "do_POST", flaky)
+    content, calls = main.complete_prompt("(90 seconds total)")
+    assert content.count("[") == 6
+    assert calls[0]['attempts'] == 3
+
+
+def test_llm_responses_are_evicted_with_the_result_cache(stub):
+    os.makedirs(main.LLM_CACHE_DIR)
+    for n in range(3):
+        path = os.path.join(main.LLM_CACHE_DIR, f"{n}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'content': "x" * 400000}, f)
+        os.utime(path, (n, n))
+    main.evict_result_cache(max_mb=1)
+    assert sorted(os.listdir(main.LLM_CACHE_DIR)) == ["1.json", "2.json"]
+
+
+async def _no_sleep(seconds):
+    return None
+
+
+def test_out_of_range_and_reversed_ids_are_dropped():
+    transcript = _transcript()
+    assert main.extract_segments_from_gpt_response("[100] - [2]\n[5] - [3]\n[4] - [40]", transcript) == []
+    assert main.extract_segments_from_gpt_response("[2] - [3]", transcript) == [(10.0, 20.0)]
+
+
+def test_long_runs_are_trimmed_to_the_last_sentence_that_fits():
+    texts = ["One idea", "goes on.", "Another", "keeps going", "and ends.", "More", "words", "here."]
+    transcript = main.build_transcript({'segments': [
+        {'start': i * 8.0, 'end': (i + 1) * 8.0, 'text': text} for i, text in enumerate(texts)]})
+    # segments 0-7 span 64 s; the last sentence end within 30 s of the start is segment 1
+    assert main.extract_segments_from_gpt_response("[0] - [7]", transcript) == [(0.0, 16.0)]
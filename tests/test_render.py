@@ -0,0 +1,41 @@
+"""Rendering through the spawned process pool, as the app does with several render workers."""
+import importlib.util
+import os
+import shutil
+import subprocess
+
+import pytest
+
+main = pytest.importorskip("main")
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+SEGMENTS = [(0.5, 2.0), (2.5, 4.0)]
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = tmp_path / "clip.mp4"
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-f", "lavfi",
+                    "-i", "sine=frequency=440", "-t", "5", "-c:v", "libx264", "-c:a", "aac", "-shortest",
+                    str(path)], check=True)
+    return str(path)
+
+
+def _render(module, clip, tmp_path):
+    outputs = [str(tmp_path / f"reel_{i + 1}.mp4") for i in range(len(SEGMENTS))]
+    results = module.render_reels_parallel(clip, SEGMENTS, outputs, video_duration=5.0, backend="ffmpeg", workers=2)
+    assert [result['error'] for result in results] == [None, None]
+    assert all(os.path.getsize(path) > 0 for path in outputs)
+
+
+def test_parallel_render_runs_on_the_process_pool(clip, tmp_path):
+    _render(main, clip, tmp_path)
+
+
+def test_parallel_render_from_a_rerun_copy_of_the_script(clip, tmp_path):
+    # streamlit re-executes main.py as a new module on every rerun; a job started from an earlier copy must
+    # still be able to hand its work to the pool
+    spec = importlib.util.spec_from_file_location("reelify_rerun", main.__file__)
+    rerun = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(rerun)
+    _render(rerun, clip, tmp_path)
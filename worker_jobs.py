@@ -0,0 +1,49 @@
+"""Process-pool entry points for reel rendering and chunked transcription.
+
+`streamlit run` executes main.py as a fresh __main__ module on every rerun, so a job thread started on an earlier
+run holds functions that no longer match __main__ and can't be pickled by reference. Pools submit the functions
+here instead: they live in an importable module, and each worker imports main as a regular module on first use.
+"""
+import time
+
+
+def render_reel_job(job):
+    """Render one reel; takes a dict of render_reel keyword arguments"""
+    import main
+    return main.render_reel(**job)
+
+
+def init_transcription_worker(model_size, threads=None):
+    """Pool initializer: cap torch's threads and load the Whisper model once per worker"""
+    import main
+    if threads:
+        # each worker's torch would otherwise use every core, oversubscribing the CPU by the worker count
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    main.get_whisper_model(model_size, "cpu")
+
+
+def transcribe_chunk(job):
+    """Transcribe one chunk and shift its segments to source time"""
+    import main
+    metrics = {}
+    cpu = time.process_time()
+    with main.measure_stage(metrics):
+        samples = main.load_audio_segment(job['media_path'], job['start'], job['end'])
+        result = {'text': '', 'segments': []}
+        if samples.size:
+            with main.use_whisper_model(job['model_size'], "cpu") as model:
+                result = model.transcribe(samples, fp16=False)
+    # whisper runs on torch's threads, so the worker's whole process CPU is what this chunk cost
+    metrics['cpu_seconds'] = round(time.process_time() - cpu, 3)
+    segments = []
+    for segment in result.get('segments', []):
+        segments.append({'start': float(segment['start']) + job['start'],
+                         'end': min(float(segment['end']) + job['start'], job['end']),
+                         'text': segment['text']})
+    return {'index': job['index'], 'start': job['start'], 'end': job['end'],
+            'text': result.get('text', '').strip(), 'segments': segments, 'language': result.get('language'),
+            'metrics': metrics}